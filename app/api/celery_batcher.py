@@ -0,0 +1,143 @@
+"""
+Soumission groupée des tâches Celery.
+
+Les tâches soumises pendant une courte fenêtre (quelques ms) sont poussées
+dans le broker Redis en un seul pipeline de LPUSH, au lieu d'un aller-retour
+broker par apply_async.
+
+Les messages sont construits avec le protocole Celery (v2) et l'enveloppe du
+transport Redis de kombu : le worker les consomme comme ceux d'apply_async.
+
+Si le broker n'est pas Redis (RabbitMQ...), retombe sur apply_async.
+Si le broker est le Redis de l'API, le pool partagé est réutilisé.
+"""
+import asyncio
+import base64
+import logging
+from bisect import bisect
+from typing import Optional
+
+import redis.asyncio as aioredis
+from celery import Task
+from kombu.serialization import dumps as kombu_dumps
+from kombu.utils.encoding import str_to_bytes
+from kombu.utils.json import dumps as json_dumps
+
+from app.celery_app import celery, PRIORITY_STEPS
+from app.config import BROKER_URL, REDIS_URL, CELERY_BATCH_MAX_SIZE, CELERY_BATCH_MAX_DELAY_MS
+from app.redis_pool import get_client
+from app.ids import next_uuid
+
+logger = logging.getLogger("llm-api")
+
+# Convention du transport Redis de kombu: une liste par palier de priorité
+PRIORITY_SEP = "\x06\x16"
+
+
+def broker_list_key(queue: str, priority: Optional[int] = None) -> str:
+    """Nom de la liste Redis pour (queue, priorité), comme kombu."""
+    step = PRIORITY_STEPS[bisect(PRIORITY_STEPS, priority or 0) - 1]
+    return f"{queue}{PRIORITY_SEP}{step}" if step else queue
+
+
+class CeleryBatcher:
+    """Regroupe les soumissions concurrentes en un pipeline Redis."""
+
+    def __init__(self, max_batch: int = CELERY_BATCH_MAX_SIZE, max_delay_ms: int = CELERY_BATCH_MAX_DELAY_MS):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.enabled = BROKER_URL.startswith(("redis://", "rediss://"))
+        self._redis: Optional[aioredis.Redis] = None
+        self._owns_redis = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.enabled:
+            logger.info("Batcher désactivé (broker non Redis), fallback apply_async")
+            return
+        self._owns_redis = BROKER_URL != REDIS_URL
+        self._redis = aioredis.from_url(BROKER_URL) if self._owns_redis else get_client()
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Batcher Celery prêt (max {self.max_batch} / {self.max_delay * 1000:.0f}ms)")
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._redis and self._owns_redis:
+            await self._redis.aclose()
+        self._redis = None
+
+    async def submit(self, task: Task, kwargs: dict, queue: str, priority: Optional[int] = None) -> str:
+        """Queue une tâche et retourne son task_id une fois poussée dans le broker."""
+        if self._worker is None:
+            result = await asyncio.to_thread(
+                task.apply_async, kwargs=kwargs, queue=queue, priority=priority
+            )
+            return result.id
+
+        task_id = next_uuid()
+        message = self._build_message(task.name, task_id, kwargs, queue, priority)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((broker_list_key(queue, priority), message, task_id, future))
+        return await future
+
+    # ------------------------------------------------------------
+    # Interne
+    # ------------------------------------------------------------
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Fenêtre de regroupement
+            await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key, message, _, _ in batch:
+                    pipe.lpush(key, message)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Batcher: échec d'envoi de {len(batch)} tâches: {e}")
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for _, _, task_id, future in batch:
+            if not future.done():
+                future.set_result(task_id)
+
+    @staticmethod
+    def _build_message(name: str, task_id: str, kwargs: dict, queue: str, priority: Optional[int]) -> str:
+        """Message Celery v2 dans l'enveloppe du transport Redis de kombu."""
+        headers, properties, body, _ = celery.amqp.create_task_message(task_id, name, (), kwargs)
+        content_type, content_encoding, payload = kombu_dumps(body, serializer=celery.conf.task_serializer)
+
+        properties.update(
+            delivery_mode=2,
+            delivery_info={"exchange": "", "routing_key": queue},
+            priority=priority or 0,
+            body_encoding="base64",
+            delivery_tag=next_uuid(),
+        )
+        return json_dumps({
+            "body": base64.b64encode(str_to_bytes(payload)).decode(),
+            "content-encoding": content_encoding,
+            "content-type": content_type,
+            "headers": headers,
+            "properties": properties,
+        })
+
+
+batcher = CeleryBatcher()
@@ -8,65 +8,108 @@ Endpoints:
 - POST /embeddings    → Batch embeddings async
 """
 import asyncio
-import json
-import uuid
 import logging
-from typing import Optional
+from typing import Literal, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from pydantic import BaseModel, Field
 from openai import AsyncOpenAI
-import redis.asyncio as aioredis
+import orjson
 
-from celery.result import AsyncResult
-from app.celery_app import celery
+from app.celery_app import celery, route_for_priority, PRIORITY_STEPS
 from app.tasks.llm_tasks import chat_completion, batch_embeddings
-from app.config import OPENAI_API_KEY, REDIS_URL
+from app.config import (
+    OPENAI_API_KEY, CELERY_STATS_REFRESH, SSE_FLUSH_BYTES, SSE_FLUSH_MS, PORT, UVICORN_WORKERS,
+    ENABLE_CORS, CORS_ORIGINS,
+)
+from app.redis_pool import POOL, get_client
+from app.ids import next_uuid
 from app.api.proxy import router as proxy_router
+from app.api.celery_batcher import batcher, broker_list_key
+from app.api.stream_hub import hub
+from app.api.task_results import get_task_meta, is_ready, is_successful
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("llm-api")
 
 # Clients async
-redis_client: Optional[aioredis.Redis] = None
 openai_client: Optional[AsyncOpenAI] = None
 
+# Stats workers (inspect) cachées dans Redis
+WORKER_STATS_KEY = "celery:stats"
+STATS_QUEUES = ("high", "default", "low", "fast")
+# Listes Redis du broker par queue (une par palier de priorité)
+STATS_LIST_KEYS = [broker_list_key(q, step) for q in STATS_QUEUES for step in PRIORITY_STEPS]
+
+
+def _inspect_workers() -> dict:
+    """Broadcast inspect (bloquant ~1s): à appeler hors event loop."""
+    inspect = celery.control.inspect()
+    stats = inspect.stats() or {}
+    active = inspect.active() or {}
+    return {
+        "workers": len(stats),
+        "active_tasks": sum(len(tasks) for tasks in active.values()),
+    }
+
+
+async def _refresh_worker_stats():
+    """Rafraîchit celery:stats toutes les CELERY_STATS_REFRESH secondes."""
+    redis_client = get_client()
+    while True:
+        try:
+            # Un seul process API fait le broadcast par période
+            if await redis_client.set(f"{WORKER_STATS_KEY}:lock", 1, nx=True, ex=CELERY_STATS_REFRESH):
+                data = await asyncio.to_thread(_inspect_workers)
+                await redis_client.set(WORKER_STATS_KEY, orjson.dumps(data), ex=CELERY_STATS_REFRESH * 2)
+        except Exception as e:
+            logger.warning(f"Refresh stats workers échoué: {e}")
+        await asyncio.sleep(CELERY_STATS_REFRESH)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup/shutdown."""
-    global redis_client, openai_client
+    global openai_client
     
-    redis_client = await aioredis.from_url(REDIS_URL, decode_responses=True)
+    # Préchauffe le pool partagé
+    await get_client().ping()
     logger.info("Redis connecté")
     
     openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
     logger.info("OpenAI client prêt")
     
+    await batcher.start()
+    stats_task = asyncio.create_task(_refresh_worker_stats())
+    
     yield
     
-    if redis_client:
-        await redis_client.close()
+    stats_task.cancel()
+    await batcher.stop()
+    await hub.close()
+    
+    await POOL.disconnect()
 
 
 app = FastAPI(
     title="LLM API",
     description="API LLM scalable avec Celery + Redis",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["X-Session-ID", "X-Task-ID", "X-Request-ID"],
-)
+if ENABLE_CORS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_methods=("GET", "POST"),
+        allow_headers=("Content-Type", "Authorization"),
+        expose_headers=("X-Session-ID", "X-Task-ID", "X-Request-ID"),
+    )
 
 # Proxy OpenAI compatible
 app.include_router(proxy_router)
@@ -90,6 +133,8 @@ class EmbeddingsRequest(BaseModel):
     texts: list[str]
     model: str = "text-embedding-3-small"
     user_id: Optional[str] = None
+    # base64: un blob float32 (shape [count, dimensions]) au lieu de listes de floats
+    encoding_format: Literal["float", "base64"] = "float"
 
 
 class TaskResponse(BaseModel):
@@ -114,14 +159,14 @@ async def health_full():
     celery_ok = False
     
     try:
-        await redis_client.ping()
+        await get_client().ping()
         redis_ok = True
     except:
         pass
     
     try:
-        stats = celery.control.inspect().stats()
-        celery_ok = stats is not None and len(stats) > 0
+        cached = await get_client().get(WORKER_STATS_KEY)
+        celery_ok = cached is not None and orjson.loads(cached)["workers"] > 0
     except:
         pass
     
@@ -140,10 +185,15 @@ async def health_full():
 @app.post("/chat", response_model=TaskResponse)
 async def chat(request: ChatRequest):
     """Chat asynchrone via Celery."""
-    session_id = request.session_id or str(uuid.uuid4())
+    session_id = request.session_id or next_uuid()
+    
+    # Session réutilisée: le stream de la réponse précédente (TTL 5 min) serait
+    # rejoué depuis le début et le client s'arrêterait à son done
+    if request.session_id:
+        await get_client().delete(f"llm:stream:{session_id}")
     
-    # Détermine la queue selon priorité
-    queue = "high" if request.priority > 5 else "low" if request.priority < -5 else "default"
+    # Détermine la queue et la priorité broker
+    queue, priority = route_for_priority(request.priority)
     
     # Construire les paramètres OpenAI
     completion_params = {
@@ -157,20 +207,21 @@ async def chat(request: ChatRequest):
     if request.user_id:
         completion_params["user"] = request.user_id
     
-    task = chat_completion.apply_async(
+    task_id = await batcher.submit(
+        chat_completion,
         kwargs={
             "session_id": session_id,
             "completion_params": completion_params,
         },
         queue=queue,
-        priority=request.priority + 10,
+        priority=priority,
     )
     
-    logger.info(f"Task {task.id} queued (queue: {queue})")
+    logger.info(f"Task {task_id} queued (queue: {queue})")
     
     return TaskResponse(
         status="queued",
-        task_id=task.id,
+        task_id=task_id,
         session_id=session_id,
         stream_url=f"/stream/{session_id}"
     )
@@ -179,19 +230,20 @@ async def chat(request: ChatRequest):
 @app.get("/chat/{task_id}")
 async def get_task_status(task_id: str):
     """Status d'une tâche Celery."""
-    result = AsyncResult(task_id, app=celery)
+    meta = await get_task_meta(task_id)
+    ready = is_ready(meta)
     
     response = {
         "task_id": task_id,
-        "status": result.status,
-        "ready": result.ready(),
+        "status": meta["status"],
+        "ready": ready,
     }
     
-    if result.ready():
-        if result.successful():
-            response["result"] = result.result
+    if ready:
+        if is_successful(meta):
+            response["result"] = meta["result"]
         else:
-            response["error"] = str(result.result)
+            response["error"] = str(meta["result"])
     
     return response
 
@@ -205,40 +257,61 @@ async def stream_sse(
     session_id: str,
     timeout: int = Query(default=900, le=1800)
 ):
-    """SSE streaming depuis Redis pub/sub. Timeout configurable (défaut 15 min, max 30 min)."""
+    """SSE streaming depuis le Redis Stream de la session. Timeout configurable (défaut 15 min, max 30 min)."""
     async def event_generator():
-        channel = f"llm:stream:{session_id}"
-        pubsub = redis_client.pubsub()
+        queue = await hub.subscribe(session_id)
         
         try:
-            await pubsub.subscribe(channel)
-            start_time = asyncio.get_event_loop().time()
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            flush_after = SSE_FLUSH_MS / 1000
             
-            async for message in pubsub.listen():
-                if asyncio.get_event_loop().time() - start_time > timeout:
-                    yield f"data: {json.dumps({'type': 'timeout'})}\n\n"
-                    break
-                
-                if message["type"] == "message":
-                    data = message['data']
-                    # Décoder si bytes
-                    if isinstance(data, bytes):
-                        data = data.decode('utf-8')
-                    
-                    yield f"data: {data}\n\n"
-                    
+            # Frames regroupées: un write par lot plutôt qu'un par token
+            buf = bytearray()
+            last_flush = loop.time()
+            
+            while True:
+                try:
+                    kind, data = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    # Attente bornée par le prochain flush ou l'échéance du stream
+                    now = loop.time()
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        buf += b'data: {"type": "timeout"}\n\n'
+                        yield bytes(buf)
+                        break
+                    wait = min(flush_after, remaining) if buf else remaining
                     try:
-                        parsed = json.loads(data)
-                        if parsed.get("type") in ("complete", "error"):
-                            break
-                    except:
-                        pass
+                        kind, data = await asyncio.wait_for(queue.get(), wait)
+                    except asyncio.TimeoutError:
+                        if buf:
+                            yield bytes(buf)
+                            buf.clear()
+                            last_flush = loop.time()
+                        continue
+                
+                # Le type d'event est porté par le channel: pas de parsing JSON
+                if kind == b"chunk":
+                    # Delta brut → event JSON pour les clients SSE
+                    buf += b'data: {"type":"chunk","content":'
+                    buf += orjson.dumps(data.decode("utf-8"))
+                    buf += b'}\n\n'
+                else:
+                    buf += b"data: " + data + b"\n\n"
+                    if kind in (b"done", b"error"):
+                        yield bytes(buf)
+                        break
+                
+                if len(buf) >= SSE_FLUSH_BYTES or loop.time() - last_flush >= flush_after:
+                    yield bytes(buf)
+                    buf.clear()
+                    last_flush = loop.time()
                         
         except asyncio.CancelledError:
             pass
         finally:
-            await pubsub.unsubscribe(channel)
-            await pubsub.close()
+            await hub.unsubscribe(session_id, queue)
     
     return StreamingResponse(
         event_generator(),
@@ -257,7 +330,7 @@ async def create_embeddings(request: EmbeddingsRequest):
         raise HTTPException(400, "Maximum 100 textes par requête")
     
     task = batch_embeddings.apply_async(
-        kwargs={"texts": request.texts, "model": request.model}
+        kwargs={"texts": request.texts, "model": request.model, "encoding_format": request.encoding_format}
     )
     
     return {"status": "queued", "task_id": task.id, "status_url": f"/embeddings/{task.id}"}
@@ -265,15 +338,15 @@ async def create_embeddings(request: EmbeddingsRequest):
 
 @app.get("/embeddings/{task_id}")
 async def get_embeddings_result(task_id: str):
-    result = AsyncResult(task_id, app=celery)
+    meta = await get_task_meta(task_id)
     
-    if not result.ready():
-        return {"status": result.status, "ready": False}
+    if not is_ready(meta):
+        return {"status": meta["status"], "ready": False}
     
-    if result.successful():
-        return {"status": "SUCCESS", "ready": True, "result": result.result}
+    if is_successful(meta):
+        return {"status": "SUCCESS", "ready": True, "result": meta["result"]}
     else:
-        raise HTTPException(500, f"Task failed: {result.result}")
+        raise HTTPException(500, f"Task failed: {meta['result']}")
 
 
 # ============================================================
@@ -285,14 +358,23 @@ async def get_stats():
     stats = {"queues": {}, "workers": 0, "status": "ok"}
     
     try:
-        for queue_name in ["high", "default", "low"]:
-            length = await redis_client.llen(queue_name)
-            stats["queues"][queue_name] = length
+        redis_client = get_client()
+        
+        # Longueurs des queues (toutes les listes de priorité) + stats workers en un aller-retour
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key in STATS_LIST_KEYS:
+                pipe.llen(key)
+            pipe.get(WORKER_STATS_KEY)
+            *lengths, cached = await pipe.execute()
         
-        active = celery.control.inspect().active()
-        if active:
-            stats["workers"] = len(active)
-            stats["active_tasks"] = sum(len(tasks) for tasks in active.values())
+        n = len(PRIORITY_STEPS)
+        for i, queue_name in enumerate(STATS_QUEUES):
+            stats["queues"][queue_name] = sum(lengths[i * n:(i + 1) * n])
+        
+        if cached:
+            workers = orjson.loads(cached)
+            stats["workers"] = workers["workers"]
+            stats["active_tasks"] = workers["active_tasks"]
             
     except Exception as e:
         stats["status"] = "error"
@@ -303,4 +385,11 @@ async def get_stats():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8007)
+    uvicorn.run(
+        "app.api.main:app",
+        host="0.0.0.0",
+        port=PORT,
+        loop="uvloop",
+        http="httptools",
+        workers=UVICORN_WORKERS,
+    )
@@ -10,17 +10,17 @@ Usage client:
     response = client.chat.completions.create(...)
 """
 import asyncio
-import json
+import logging
 import time
-import uuid
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Header
-from fastapi.responses import StreamingResponse
-import redis.asyncio as aioredis
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import Response, StreamingResponse
+import msgspec
+import orjson
+from redis.exceptions import RedisError
 
 # Types OpenAI natifs
 from openai import OpenAI
-from openai.types import Model
 from openai.types.chat import (
     ChatCompletion,
     ChatCompletionChunk,
@@ -30,13 +30,26 @@ from openai.types.chat.chat_completion import Choice
 from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice, ChoiceDelta
 from openai.types.completion_usage import CompletionUsage
 
-from app.config import REDIS_URL, OPENAI_API_KEY, API_TIMEOUT
+from app.config import (
+    OPENAI_API_KEY,
+    OPENAI_MODELS_CACHE_TTL,
+    API_TIMEOUT,
+    SSE_FLUSH_BYTES,
+    SSE_FLUSH_MS,
+)
+from app.celery_app import route_for_priority
+from app.api.task_results import get_task_meta, is_ready, is_successful
 from app.tasks.llm_tasks import chat_completion as chat_completion_task
+from app.api.celery_batcher import batcher
+from app.api.stream_hub import hub
+from app.redis_pool import get_client
+from app.ids import next_id_hex, next_uuid
 
-router = APIRouter(prefix="/v1", tags=["OpenAI Proxy"])
+__all__ = ["router"]
+
+logger = logging.getLogger("llm-api")
 
-# Redis client (sera initialisé via lifespan de main.py)
-redis_client: Optional[aioredis.Redis] = None
+router = APIRouter(prefix="/v1", tags=["OpenAI Proxy"])
 
 # Client OpenAI pour récupérer les modèles
 _openai_client: Optional[OpenAI] = None
@@ -49,11 +62,16 @@ def get_openai_client() -> OpenAI:
     return _openai_client
 
 
-async def get_redis():
-    global redis_client
-    if redis_client is None:
-        redis_client = await aioredis.from_url(REDIS_URL, decode_responses=True)
-    return redis_client
+# ============================================================
+# VALIDATION
+# ============================================================
+
+class ChatReq(msgspec.Struct, kw_only=True):
+    """Champs lus par le proxy; les autres paramètres OpenAI passent tels quels."""
+    model: str = "gpt-4o-mini"
+    messages: list[dict]
+    stream: bool = False
+    priority: int = 0
 
 
 # ============================================================
@@ -62,7 +80,7 @@ async def get_redis():
 
 @router.post("/chat/completions")
 async def chat_completions(
-    request: dict,
+    raw: Request,
     authorization: Optional[str] = Header(None)
 ):
     """
@@ -86,31 +104,39 @@ async def chat_completions(
     Extension proxy:
     - priority: int [-10, 10] pour la queue (high > 5, low < -5, default sinon)
     """
-    session_id = str(uuid.uuid4())
-    request_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    session_id = next_uuid()
+    request_id = f"chatcmpl-{next_id_hex(24)}"
     
-    # Extraire l'extension proxy et la retirer des params OpenAI
-    priority = request.pop("priority", 0)
+    # Décodage bytes → dict (msgspec), puis validation des champs lus par le proxy
+    try:
+        completion_params = msgspec.json.decode(await raw.body())
+        req = msgspec.convert(completion_params, ChatReq)
+    except msgspec.DecodeError:
+        raise HTTPException(400, "Invalid JSON body")
+    except msgspec.ValidationError as e:
+        raise HTTPException(400, str(e))
     
-    # Valider la présence de messages
-    if not request.get("messages"):
+    if not req.messages:
         raise HTTPException(400, "messages field is required")
     
-    # Paramètres OpenAI (tout le reste)
-    completion_params = request
-    model = completion_params.get("model", "gpt-4o-mini")
-    stream = completion_params.get("stream", False)
+    # Extraire l'extension proxy; le reste du dict part tel quel à OpenAI
+    completion_params.pop("priority", None)
+    priority = req.priority
+    model = req.model
+    stream = req.stream
     
-    # Déterminer la queue basée sur la priorité
-    queue = "high" if priority > 5 else "low" if priority < -5 else "default"
+    # Déterminer la queue et la priorité broker
+    queue, broker_priority = route_for_priority(priority)
     
     # Queue la tâche Celery avec TOUS les paramètres OpenAI
-    task = chat_completion_task.apply_async(
+    task_id = await batcher.submit(
+        chat_completion_task,
         kwargs={
             "session_id": session_id,
             "completion_params": completion_params,
         },
         queue=queue,
+        priority=broker_priority,
     )
     
     if stream:
@@ -121,110 +147,135 @@ async def chat_completions(
         )
     else:
         # Attendre le résultat Celery directement
-        return await _wait_celery_result(task.id, request_id, model)
+        return await _wait_celery_result(task_id, request_id, model)
 
 
 async def _stream_response(session_id: str, request_id: str, model: str):
     """Génère les events SSE au format OpenAI avec types natifs."""
-    redis = await get_redis()
-    channel = f"llm:stream:{session_id}"
-    pubsub = redis.pubsub()
+    queue = await hub.subscribe(session_id)
     
     try:
-        await pubsub.subscribe(channel)
         created = int(time.time())
+        loop = asyncio.get_running_loop()
+        flush_after = SSE_FLUSH_MS / 1000
         
-        async for message in pubsub.listen():
-            if message["type"] == "message":
-                data = message["data"]
-                if isinstance(data, bytes):
-                    data = data.decode("utf-8")
-                
+        # Template pré-calculé du chunk OpenAI: seul le contenu est encodé par token
+        chunk_prefix = (
+            b'data: {"id":' + orjson.dumps(request_id)
+            + b',"object":"chat.completion.chunk","created":' + str(created).encode()
+            + b',"model":' + orjson.dumps(model)
+            + b',"choices":[{"index":0,"delta":{"content":'
+        )
+        chunk_suffix = b'},"finish_reason":null}]}\n\n'
+        
+        # Frames regroupées: un write par lot plutôt qu'un par token
+        buf = bytearray()
+        last_flush = loop.time()
+        
+        while True:
+            try:
+                kind, data = queue.get_nowait()
+            except asyncio.QueueEmpty:
                 try:
-                    parsed = json.loads(data)
-                    
-                    if parsed.get("type") == "chunk" and parsed.get("content"):
-                        # Format OpenAI streaming avec types natifs
-                        chunk = ChatCompletionChunk(
-                            id=request_id,
-                            object="chat.completion.chunk",
-                            created=created,
-                            model=model,
-                            choices=[
-                                ChunkChoice(
-                                    index=0,
-                                    delta=ChoiceDelta(content=parsed["content"]),
-                                    finish_reason=None
-                                )
-                            ]
-                        )
-                        yield f"data: {chunk.model_dump_json()}\n\n"
-                    
-                    elif parsed.get("type") == "complete":
-                        # Final chunk avec finish_reason
-                        final_chunk = ChatCompletionChunk(
-                            id=request_id,
-                            object="chat.completion.chunk",
-                            created=created,
-                            model=model,
-                            choices=[
-                                ChunkChoice(
-                                    index=0,
-                                    delta=ChoiceDelta(),
-                                    finish_reason="stop"
-                                )
-                            ]
+                    kind, data = await asyncio.wait_for(queue.get(), flush_after if buf else 1.0)
+                except asyncio.TimeoutError:
+                    if buf:
+                        yield bytes(buf)
+                        buf.clear()
+                        last_flush = loop.time()
+                    continue
+            
+            # Le type d'event est porté par le channel: pas de parsing JSON
+            if kind == b"chunk":
+                buf += chunk_prefix
+                buf += orjson.dumps(data.decode("utf-8"))
+                buf += chunk_suffix
+                
+                if len(buf) >= SSE_FLUSH_BYTES or loop.time() - last_flush >= flush_after:
+                    yield bytes(buf)
+                    buf.clear()
+                    last_flush = loop.time()
+            
+            elif kind == b"done":
+                # Final chunk avec finish_reason
+                final_chunk = ChatCompletionChunk(
+                    id=request_id,
+                    object="chat.completion.chunk",
+                    created=created,
+                    model=model,
+                    choices=[
+                        ChunkChoice(
+                            index=0,
+                            delta=ChoiceDelta(),
+                            finish_reason="stop"
                         )
-                        yield f"data: {final_chunk.model_dump_json()}\n\n"
-                        yield "data: [DONE]\n\n"
-                        break
-                    
-                    elif parsed.get("type") == "error":
-                        error_chunk = {
-                            "error": {
-                                "message": parsed.get("error", "Unknown error"),
-                                "type": "server_error"
-                            }
-                        }
-                        yield f"data: {json.dumps(error_chunk)}\n\n"
-                        break
-                        
-                except json.JSONDecodeError:
-                    pass
+                    ]
+                )
+                buf += b"data: " + final_chunk.model_dump_json().encode() + b"\n\n"
+                buf += b"data: [DONE]\n\n"
+                yield bytes(buf)
+                break
+            
+            elif kind == b"error":
+                try:
+                    error = orjson.loads(data).get("error", "Unknown error")
+                except orjson.JSONDecodeError:
+                    error = "Unknown error"
+                error_chunk = {
+                    "error": {
+                        "message": error,
+                        "type": "server_error"
+                    }
+                }
+                buf += b"data: " + orjson.dumps(error_chunk) + b"\n\n"
+                yield bytes(buf)
+                break
                     
     finally:
-        await pubsub.unsubscribe(channel)
-        await pubsub.close()
+        await hub.unsubscribe(session_id, queue)
 
 
 async def _wait_celery_result(task_id: str, request_id: str, model: str):
     """
     Attendre le résultat Celery et retourner la réponse OpenAI complète.
     
-    Retourne directement le dict de la réponse OpenAI pour préserver
-    tous les champs (tool_calls, function_call, refusal, etc.)
-    """
-    from celery.result import AsyncResult
-    from app.celery_app import celery
+    Pas de polling: on s'abonne à llm:done:{task_id}, publié par la tâche à la fin
+    avec le résultat complet (pas de lecture du result backend).
     
-    result = AsyncResult(task_id, app=celery)
-    
-    # Polling async du résultat (timeout depuis config)
-    start = time.time()
-    
-    while not result.ready():
-        if time.time() - start > API_TIMEOUT:
-            raise HTTPException(504, f"Request timeout after {API_TIMEOUT}s")
-        await asyncio.sleep(0.5)
-    
-    if result.failed():
-        raise HTTPException(500, f"Task failed: {result.result}")
+    Retourne directement la réponse OpenAI brute (llm:raw:{task_id}) pour
+    préserver tous les champs (tool_calls, function_call, refusal, etc.)
+    """
+    redis = get_client()
+    channel = f"llm:done:{task_id}"
+    pubsub = redis.pubsub()
     
-    task_result = result.result
+    try:
+        # S'abonner AVANT de vérifier le backend (sinon la notification peut être perdue)
+        await pubsub.subscribe(channel)
+        
+        meta = await get_task_meta(task_id)
+        if is_ready(meta):
+            # Tâche terminée avant l'abonnement
+            if not is_successful(meta):
+                raise HTTPException(500, f"Task failed: {meta['result']}")
+            task_result = meta["result"]
+        else:
+            try:
+                done = await asyncio.wait_for(_next_done(pubsub), timeout=API_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HTTPException(504, f"Request timeout after {API_TIMEOUT}s")
+            
+            if done.get("status") != "SUCCESS":
+                raise HTTPException(500, f"Task failed: {done.get('error')}")
+            task_result = done.get("result")
+    finally:
+        await pubsub.unsubscribe(channel)
+        await pubsub.close()
     
     # Si on a la réponse complète de l'API, l'utiliser directement
-    if isinstance(task_result, dict) and "full_response" in task_result:
-        response_data = task_result["full_response"]
+    raw = await redis.get(f"llm:raw:{task_id}")
+    if raw is not None:
+        response_data = orjson.loads(raw)
         # Override l'ID avec notre request_id pour cohérence
         response_data["id"] = request_id
         return response_data
@@ -232,6 +283,8 @@ async def _wait_celery_result(task_id: str, request_id: str, model: str):
     # Fallback: construire une réponse basique
     content = task_result.get("response", "") if isinstance(task_result, dict) else str(task_result)
     usage_data = task_result.get("usage") if isinstance(task_result, dict) else None
+    # Estimation ~4 caractères/token si OpenAI n'a pas renvoyé d'usage
+    tok = max(1, len(content) >> 2)
     
     return ChatCompletion(
         id=request_id,
@@ -250,38 +303,72 @@ async def _wait_celery_result(task_id: str, request_id: str, model: str):
         ],
         usage=CompletionUsage(
             prompt_tokens=usage_data.get("prompt_tokens", 0) if usage_data else 0,
-            completion_tokens=usage_data.get("completion_tokens", 0) if usage_data else len(content.split()),
-            total_tokens=usage_data.get("total_tokens", 0) if usage_data else len(content.split())
+            completion_tokens=usage_data.get("completion_tokens", 0) if usage_data else tok,
+            total_tokens=usage_data.get("total_tokens", 0) if usage_data else tok
         )
     )
 
 
+async def _next_done(pubsub) -> dict:
+    """Premier message de fin reçu sur le channel llm:done:{task_id}."""
+    async for message in pubsub.listen():
+        if message["type"] == "message":
+            return orjson.loads(message["data"])
+
+
 # ============================================================
 # AUTRES ENDPOINTS OPENAI
 # ============================================================
 
+async def _cached_openai(key: str, fetch) -> Response:
+    """
+    Sert une réponse OpenAI depuis le cache Redis (JSON brut, TTL court).
+    
+    En cas de miss, l'appel SDK (bloquant) part dans un thread. Redis
+    indisponible: le cache est ignoré et l'appel OpenAI part directement.
+    """
+    redis = get_client()
+    try:
+        cached = await redis.get(key)
+    except RedisError as e:
+        logger.warning(f"Cache {key} indisponible: {e}")
+        cached = None
+    
+    if cached is None:
+        data = await asyncio.to_thread(lambda: fetch().model_dump())
+        cached = orjson.dumps(data)
+        try:
+            await redis.set(key, cached, ex=OPENAI_MODELS_CACHE_TTL)
+        except RedisError as e:
+            logger.warning(f"Cache {key} non écrit: {e}")
+    
+    return Response(content=cached, media_type="application/json")
+
+
 @router.get("/models")
 async def list_models():
     """
     Liste des modèles disponibles via l'API OpenAI.
-    Retourne directement les modèles depuis OpenAI.
+    Mise en cache Redis (OPENAI_MODELS_CACHE_TTL).
     """
     try:
         client = get_openai_client()
-        models = client.models.list()
-        return models
+        return await _cached_openai("openai:models", client.models.list)
     except Exception as e:
         raise HTTPException(500, f"Failed to fetch models: {str(e)}")
 
 
 @router.get("/models/{model_id}")
-async def get_model(model_id: str) -> Model:
+async def get_model(model_id: str) -> Response:
     """
     Récupère les détails d'un modèle spécifique via l'API OpenAI.
+    Mise en cache Redis (OPENAI_MODELS_CACHE_TTL).
     """
     try:
         client = get_openai_client()
-        model = client.models.retrieve(model_id)
-        return model
+        return await _cached_openai(
+            f"openai:model:{model_id}",
+            lambda: client.models.retrieve(model_id)
+        )
     except Exception as e:
         raise HTTPException(404, f"Model not found: {str(e)}")
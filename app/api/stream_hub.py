@@ -0,0 +1,164 @@
+"""
+Hub de streaming par session.
+
+Une seule lecture Redis pour tout le process: un reader unique fait un XREAD
+multi-clés sur les streams llm:stream:{session_id} de toutes les sessions
+suivies, quel que soit le nombre de sessions et de clients HTTP par session
+(reconnexions, observateurs). Chaque event est redistribué dans une
+asyncio.Queue par client. Le reader ne tient qu'une connexion du pool
+partagé: les appels Redis des requêtes (batcher, /stats) ne sont pas
+affamés par les streams ouverts.
+
+L'XREAD bloque au plus READ_BLOCK_MS: une session ajoutée pendant un blocage
+est prise en compte au tour suivant.
+
+Chaque session est lue depuis le début du stream: les events ajoutés par le
+worker avant la connexion SSE ne sont pas perdus (contrairement au pub/sub).
+Un client qui rejoint une session en cours de lecture reçoit d'abord
+l'historique local; une session terminée (event de fin lu) est relue depuis
+Redis, où POST /chat a vidé le stream si le session_id est réutilisé.
+
+Les éléments des queues sont des tuples (kind, data) en bytes, kind valant
+b"status", b"chunk", b"done" ou b"error".
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.redis_pool import get_client
+
+logger = logging.getLogger("llm-api")
+
+SUBSCRIBER_QUEUE_SIZE = 1024
+# Entrées lues par stream et par XREAD (un aller-retour par lot)
+READ_COUNT = 256
+# Blocage max d'un XREAD (latence de prise en compte d'une nouvelle session)
+READ_BLOCK_MS = 50
+
+_TERMINAL = (b"done", b"error")
+_OVERFLOW = (b"error", b'{"type": "error", "error": "stream overflow"}')
+_INTERRUPTED = (b"error", b'{"type": "error", "error": "stream interrupted"}')
+
+
+class _Session:
+    """Lecture partagée du stream d'une session."""
+
+    def __init__(self, key: str):
+        self.key = key.encode()
+        self.last_id = b"0"
+        self.done = False
+        self.subscribers: set[asyncio.Queue] = set()
+        # Clients coupés (trop lents), encore à désinscrire
+        self.dropped: set[asyncio.Queue] = set()
+        self.history: list[tuple] = []
+
+
+class SessionHub:
+    """Fan-out Redis Streams → queues locales, un seul reader (XREAD multi-clés)."""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._sessions: dict[str, _Session] = {}
+        # Sessions en cours de lecture, par clé de stream
+        self._active: dict[bytes, _Session] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    async def subscribe(self, session_id: str) -> asyncio.Queue:
+        """Queue du client (le premier client démarre la lecture depuis le début)."""
+        session = self._sessions.get(session_id)
+
+        # Lecture terminée: un nouveau client suit la réponse suivante, pas l'ancien historique
+        if session is None or session.done:
+            session = _Session(f"llm:stream:{session_id}")
+            self._sessions[session_id] = session
+            self._active[session.key] = session
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+
+        # Rejoue les events déjà reçus par la session
+        queue = asyncio.Queue(maxsize=self.queue_size + len(session.history))
+        for item in session.history:
+            queue.put_nowait(item)
+        session.subscribers.add(queue)
+
+        return queue
+
+    async def unsubscribe(self, session_id: str, queue: asyncio.Queue):
+        """Retire la queue; arrête la lecture de la session avec le dernier client."""
+        session = self._sessions.get(session_id)
+        # Queue d'une session remplacée (session_id réutilisé): rien à faire
+        if session is None or (queue not in session.subscribers and queue not in session.dropped):
+            return
+        session.subscribers.discard(queue)
+        session.dropped.discard(queue)
+        if session.subscribers or session.dropped:
+            return
+
+        del self._sessions[session_id]
+        if self._active.get(session.key) is session:
+            del self._active[session.key]
+
+    async def close(self):
+        """Arrête la lecture (shutdown)."""
+        self._sessions.clear()
+        self._active.clear()
+        if self._reader and not self._reader.done():
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        self._reader = None
+
+    # ------------------------------------------------------------
+    # Interne
+    # ------------------------------------------------------------
+
+    async def _read(self):
+        redis = get_client()
+        try:
+            # S'arrête quand plus aucune session n'est suivie (relancé par subscribe)
+            while self._active:
+                streams = {key: session.last_id for key, session in self._active.items()}
+                result = await redis.xread(streams, count=READ_COUNT, block=READ_BLOCK_MS)
+                for key, entries in result or ():
+                    session = self._active.get(key)
+                    if session is None:
+                        continue  # Plus de client pendant l'XREAD
+                    for entry_id, fields in entries:
+                        session.last_id = entry_id
+                        item = (fields[b"t"], fields[b"d"])
+                        self._dispatch(session, item)
+                        if item[0] in _TERMINAL:
+                            session.done = True
+                            del self._active[key]
+                            break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stream hub: lecture des streams interrompue: {e}")
+            sessions = list(self._active.values())
+            self._active.clear()
+            for session in sessions:
+                session.done = True
+                for queue in tuple(session.subscribers):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(_INTERRUPTED)
+
+    @staticmethod
+    def _dispatch(session: _Session, item: tuple):
+        session.history.append(item)
+        for queue in tuple(session.subscribers):
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Client trop lent: on le coupe plutôt que de bloquer les autres
+                logger.warning("Stream hub: client trop lent, déconnecté")
+                session.subscribers.discard(queue)
+                session.dropped.add(queue)
+                queue.get_nowait()
+                queue.put_nowait(_OVERFLOW)
+
+
+hub = SessionHub()
@@ -0,0 +1,45 @@
+"""
+Lecture async des résultats Celery.
+
+AsyncResult.ready()/.result passent par le client redis-py synchrone de
+Celery et bloquent l'event loop. Si le result backend est le Redis de l'API,
+la clé celery-task-meta-{id} est lue via le pool async partagé et décodée
+par le backend Celery (msgpack/json, exceptions reconstruites).
+
+Sinon (backend distinct), AsyncResult est appelé dans un thread.
+"""
+import asyncio
+
+from celery import states
+from celery.result import AsyncResult
+
+from app.celery_app import celery
+from app.config import REDIS_URL, RESULT_BACKEND
+from app.redis_pool import get_client
+
+_DIRECT = RESULT_BACKEND == REDIS_URL
+
+
+def _meta_from_async_result(task_id: str) -> dict:
+    """Meta via AsyncResult (bloquant): à appeler hors event loop."""
+    result = AsyncResult(task_id, app=celery)
+    return {"status": result.status, "result": result.result}
+
+
+async def get_task_meta(task_id: str) -> dict:
+    """Meta de la tâche: {"status", "result"} (result = exception si FAILURE)."""
+    if not _DIRECT:
+        return await asyncio.to_thread(_meta_from_async_result, task_id)
+
+    raw = await get_client().get(celery.backend.get_key_for_task(task_id))
+    if raw is None:
+        return {"status": states.PENDING, "result": None}
+    return celery.backend.decode_result(raw)
+
+
+def is_ready(meta: dict) -> bool:
+    return meta["status"] in states.READY_STATES
+
+
+def is_successful(meta: dict) -> bool:
+    return meta["status"] == states.SUCCESS
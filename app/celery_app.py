@@ -1,8 +1,11 @@
 """
 Configuration Celery avec Redis.
 
-Lancer le worker :
-    celery -A app.celery_app worker --loglevel=info --concurrency=4
+Lancer les workers :
+    # Appels chat (longs): prefetch 1, acks tardifs
+    celery -A app.celery_app worker -Q high,default,low --prefetch-multiplier=1 -O fair --without-mingle --without-gossip
+    # Tâches courtes (embeddings): prefetch 4, sans rate limit
+    CELERY_DISABLE_RATE_LIMITS=1 celery -A app.celery_app worker -Q fast --prefetch-multiplier=4 --without-mingle
     
 Toute la config est pilotée via les variables d'environnement (voir config.py)
 """
@@ -17,6 +20,7 @@ from app.config import (
     CELERY_RESULT_EXPIRES,
     CELERY_PREFETCH_MULTIPLIER,
     CELERY_QUEUES,
+    CELERY_DISABLE_RATE_LIMITS,
 )
 
 # Celery app
@@ -35,12 +39,27 @@ print(f"[Celery] Queues: {CELERY_QUEUES}")
 queue_names = [q.strip() for q in CELERY_QUEUES.split(",") if q.strip()]
 task_queues = tuple(Queue(name, routing_key=name) for name in queue_names)
 
+# Priorités fines dans chaque queue (transport Redis: une liste par palier, 0 = plus prioritaire)
+PRIORITY_STEPS = list(range(10))
+
+
+def route_for_priority(priority: int) -> tuple[str, int]:
+    """
+    Priorité API [-10, 10] → (queue, priorité broker).
+    
+    La queue reste high/default/low (workers dédiés possibles), la priorité
+    broker ordonne strictement les tâches à l'intérieur de chaque queue.
+    """
+    priority = max(-10, min(10, priority))
+    queue = "high" if priority > 5 else "low" if priority < -5 else "default"
+    return queue, PRIORITY_STEPS[-1] - round((priority + 10) * PRIORITY_STEPS[-1] / 20)
+
 # Configuration
 celery.conf.update(
-    # Serialization
+    # Serialization (résultats en msgpack: plus compacts et plus rapides que JSON)
     task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    accept_content=["json", "msgpack"],
+    result_serializer="msgpack",
     
     # Timezone
     timezone="UTC",
@@ -56,17 +75,16 @@ celery.conf.update(
     
     # Queues avec priorités (depuis env)
     task_queues=task_queues,
+    # Consommation stricte: queues dans l'ordre de CELERY_QUEUES, puis par palier
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "queue_order_strategy": "priority",
+    },
     task_default_queue="default" if "default" in queue_names else queue_names[0],
     task_default_routing_key="default" if "default" in queue_names else queue_names[0],
-    
-    # Rate limiting natif Celery (depuis env)
-    task_annotations={
-        "app.tasks.llm_tasks.chat_completion": {
-            "rate_limit": CELERY_RATE_LIMIT
-        },
-        "app.tasks.llm_tasks.batch_embeddings": {
-            "rate_limit": CELERY_RATE_LIMIT
-        }
+    # Tâches courtes sur un pool dédié (prefetch > 1, ack immédiat)
+    task_routes={
+        "app.tasks.llm_tasks.batch_embeddings": {"queue": "fast"},
     },
     
     # Retry
@@ -75,6 +93,7 @@ celery.conf.update(
     
     # Concurrency control (depuis env)
     worker_prefetch_multiplier=CELERY_PREFETCH_MULTIPLIER,
+    worker_disable_rate_limits=CELERY_DISABLE_RATE_LIMITS,
     
     # Startup retry
     broker_connection_retry_on_startup=True,
@@ -16,6 +16,7 @@ OPENAI_ORG_ID = os.getenv("OPENAI_ORG_ID", "").strip() or None
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip() or None  # Pour proxy/Azure
 OPENAI_DEFAULT_MODEL = os.getenv("OPENAI_DEFAULT_MODEL", "gpt-4o-mini").strip()
 OPENAI_TIMEOUT = int(os.getenv("OPENAI_TIMEOUT", "600"))  # 10 min par défaut (o1/o3 peuvent être longs)
+OPENAI_MODELS_CACHE_TTL = int(os.getenv("OPENAI_MODELS_CACHE_TTL", "300"))  # Cache Redis de /v1/models
 
 # ============================================================
 # REDIS / BROKER
@@ -23,6 +24,8 @@ OPENAI_TIMEOUT = int(os.getenv("OPENAI_TIMEOUT", "600"))  # 10 min par défaut (
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0").strip()
 BROKER_URL = os.getenv("BROKER_URL", REDIS_URL).strip()
 RESULT_BACKEND = os.getenv("RESULT_BACKEND", REDIS_URL).strip()
+# Pool partagé côté API (chaque stream SSE garde une connexion pub/sub)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "512"))
 
 # ============================================================
 # CELERY - RATE LIMITING (natif Celery)
@@ -40,6 +43,7 @@ CELERY_TASK_TIME_LIMIT = int(os.getenv("CELERY_TASK_TIME_LIMIT", "900"))  # 15 m
 CELERY_TASK_SOFT_TIME_LIMIT = int(os.getenv("CELERY_TASK_SOFT_TIME_LIMIT", "870"))  # Warning 14.5 min
 CELERY_RESULT_EXPIRES = int(os.getenv("CELERY_RESULT_EXPIRES", "3600"))  # 1h rétention
 CELERY_MAX_RETRIES = int(os.getenv("CELERY_MAX_RETRIES", "3"))
+CELERY_MAX_QUOTA_WAITS = int(os.getenv("CELERY_MAX_QUOTA_WAITS", "10"))  # Replanifications sur quota OpenAI épuisé
 CELERY_RETRY_BACKOFF_MAX = int(os.getenv("CELERY_RETRY_BACKOFF_MAX", "60"))  # secondes
 
 # ============================================================
@@ -51,9 +55,14 @@ CELERY_POOL = os.getenv("CELERY_POOL", "gevent").strip()
 CELERY_CONCURRENCY = int(os.getenv("CELERY_CONCURRENCY", "100"))
 CELERY_PREFETCH_MULTIPLIER = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
 CELERY_QUEUES = os.getenv("CELERY_QUEUES", "high,default,low").strip()
+# Worker "fast" (embeddings): désactive le rate limiting Celery côté worker
+CELERY_DISABLE_RATE_LIMITS = os.getenv("CELERY_DISABLE_RATE_LIMITS", "0").strip() == "1"
 CELERY_LOGLEVEL = os.getenv("CELERY_LOGLEVEL", "info").strip()
 # Max mémoire par child (prefork uniquement, en KB, 0=désactivé)
 CELERY_MAX_MEMORY_PER_CHILD = int(os.getenv("CELERY_MAX_MEMORY_PER_CHILD", "0"))
+# Publication des deltas streamés: deltas fusionnés en une entrée (N caractères ou N ms)
+STREAM_PUBLISH_MIN_CHARS = int(os.getenv("STREAM_PUBLISH_MIN_CHARS", "32"))
+STREAM_PUBLISH_MS = int(os.getenv("STREAM_PUBLISH_MS", "20"))
 
 # ============================================================
 # API SETTINGS
@@ -61,6 +70,20 @@ CELERY_MAX_MEMORY_PER_CHILD = int(os.getenv("CELERY_MAX_MEMORY_PER_CHILD", "0"))
 PORT = int(os.getenv("PORT", "8007"))
 UVICORN_WORKERS = int(os.getenv("UVICORN_WORKERS", "4"))
 API_TIMEOUT = int(os.getenv("API_TIMEOUT", "900"))  # Timeout proxy (doit être >= CELERY_TASK_TIME_LIMIT)
+# Soumission groupée des tâches (un pipeline Redis par fenêtre)
+CELERY_BATCH_MAX_SIZE = int(os.getenv("CELERY_BATCH_MAX_SIZE", "256"))
+CELERY_BATCH_MAX_DELAY_MS = int(os.getenv("CELERY_BATCH_MAX_DELAY_MS", "2"))
+# Stats workers Celery (inspect) rafraîchies en tâche de fond et cachées dans Redis
+CELERY_STATS_REFRESH = int(os.getenv("CELERY_STATS_REFRESH", "5"))
+# Regroupement des frames SSE (flush dès qu'un seuil est atteint)
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "4096"))
+SSE_FLUSH_MS = int(os.getenv("SSE_FLUSH_MS", "20"))
+# CORS désactivé par défaut (à gérer au reverse proxy en production)
+# Activer pour l'UI servie sur un autre port (origines explicites, pas de "*")
+ENABLE_CORS = os.getenv("ENABLE_CORS", "0").strip() == "1"
+CORS_ORIGINS = tuple(
+    o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") if o.strip()
+)
 
 # ============================================================
 # UI
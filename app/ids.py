@@ -0,0 +1,47 @@
+"""
+Génération d'identifiants (session, tâche, requête).
+
+Les IDs sont des secrets: /stream/{session_id}, /chat/{task_id} et
+/embeddings/{task_id} ne sont protégés que par leur imprévisibilité. Ils
+sont donc tirés d'os.urandom (CSPRNG), mais par blocs de 4 KiB découpés en
+IDs: un syscall pour ~250 IDs au lieu d'un par uuid.uuid4().
+"""
+import os
+import threading
+
+_BLOCK_SIZE = 4096
+
+_lock = threading.Lock()
+_block = b""
+_pos = 0
+
+
+def _reset():
+    # Après un fork, le fils ne doit pas réutiliser le bloc du parent
+    global _block, _pos
+    _block, _pos = b"", 0
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def _random_bytes(k: int) -> bytes:
+    """k octets aléatoires (k <= _BLOCK_SIZE), pris dans le bloc urandom courant."""
+    global _block, _pos
+    with _lock:
+        if _pos + k > len(_block):
+            _block, _pos = os.urandom(_BLOCK_SIZE), 0
+        chunk = _block[_pos:_pos + k]
+        _pos += k
+    return chunk
+
+
+def next_id_hex(n: int = 32) -> str:
+    """Token de n caractères hexadécimaux."""
+    return _random_bytes((n + 1) // 2).hex()[:n]
+
+
+def next_uuid() -> str:
+    """ID au format UUID (8-4-4-4-12), comme str(uuid.uuid4())."""
+    h = next_id_hex(32)
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
@@ -0,0 +1,25 @@
+"""
+Pool de connexions Redis partagé (côté API, async).
+
+Un seul pool par process pour main.py, proxy.py et le batcher Celery.
+Les connexions restent en bytes (decode_responses=False): les payloads
+pub/sub sont relayés tels quels en SSE. Keepalive TCP + health check pour
+les connexions pub/sub longues des streams SSE.
+"""
+import redis.asyncio as aioredis
+
+from app.config import REDIS_URL, REDIS_MAX_CONNECTIONS
+
+POOL = aioredis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_keepalive=True,
+    health_check_interval=30,
+)
+
+_client = aioredis.Redis(connection_pool=POOL)
+
+
+def get_client() -> aioredis.Redis:
+    """Client Redis adossé au pool partagé."""
+    return _client
@@ -2,17 +2,29 @@
 Tâches Celery pour les appels LLM.
 
 Features:
-- Rate limiting via Celery natif (configuré dans celery_app.py)
-- Retry automatique avec backoff exponentiel
+- Rate limiting via Celery natif (rate_limit des tâches, CELERY_RATE_LIMIT)
+- Retry automatique avec backoff exponentiel (erreurs transitoires uniquement)
 - Priorité des tâches via queues
-- Streaming via Redis pub/sub
+- Streaming via Redis Streams (rejouable à la reconnexion)
 """
-import json
+import base64
+import orjson
 import logging
+import queue
+import re
+import threading
+import time
 from typing import Optional
-from celery import shared_task
-from celery.exceptions import SoftTimeLimitExceeded
-from openai import OpenAI
+from celery import Task, shared_task
+from celery.exceptions import Ignore, SoftTimeLimitExceeded
+from openai import (
+    OpenAI,
+    DefaultHttpxClient,
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+)
+import httpx
 import redis
 
 from app.config import (
@@ -22,8 +34,14 @@ from app.config import (
     OPENAI_DEFAULT_MODEL,
     OPENAI_TIMEOUT,
     REDIS_URL,
+    CELERY_CONCURRENCY,
+    CELERY_RATE_LIMIT,
     CELERY_MAX_RETRIES,
+    CELERY_MAX_QUOTA_WAITS,
     CELERY_RETRY_BACKOFF_MAX,
+    CELERY_TASK_TIME_LIMIT,
+    STREAM_PUBLISH_MIN_CHARS,
+    STREAM_PUBLISH_MS,
 )
 
 logger = logging.getLogger(__name__)
@@ -45,41 +63,263 @@ def get_openai() -> OpenAI:
             organization=OPENAI_ORG_ID,
             base_url=OPENAI_BASE_URL,
             timeout=OPENAI_TIMEOUT,
+            # Pas de retry/sleep dans le SDK: les erreurs remontent et Celery
+            # replanifie la tâche (le slot worker est libéré pendant l'attente)
+            max_retries=0,
+            # HTTP/2: les greenlets du worker multiplexent quelques connexions TLS
+            http_client=DefaultHttpxClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=CELERY_CONCURRENCY * 2,
+                    max_keepalive_connections=CELERY_CONCURRENCY,
+                ),
+            ),
         )
     return _openai_client
 
 
 def get_redis() -> redis.Redis:
-    """Lazy init du client Redis."""
+    """Lazy init du client Redis (parser hiredis si installé, auto-détecté par redis-py)."""
     global _redis_client
     if _redis_client is None:
-        _redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        _redis_client = redis.from_url(
+            REDIS_URL,
+            decode_responses=True,
+            # Une connexion par tâche concurrente + marge (publish pendant le stream)
+            max_connections=CELERY_CONCURRENCY * 2,
+            socket_keepalive=True,
+            health_check_interval=30,
+        )
     return _redis_client
 
 
+# Erreurs transitoires: seules celles-ci sont retentées (pas les 400, bugs de payload...)
+TRANSIENT_ERRORS = (
+    APIConnectionError,  # Inclut APITimeoutError
+    InternalServerError,  # 5xx OpenAI
+    RateLimitError,
+    redis.ConnectionError,
+    redis.TimeoutError,
+)
+
+
+class StreamInterrupted(Exception):
+    """Erreur après publication de deltas: pas de retry (il dupliquerait le contenu déjà streamé)."""
+
+
+def _retry_after(exc: RateLimitError, retries: int) -> float:
+    """Délai indiqué par OpenAI sur un 429 (retry-after-ms / retry-after), sinon backoff."""
+    headers = exc.response.headers if exc.response is not None else {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(float(value) * scale, 0.05)
+            except ValueError:
+                pass  # Format date HTTP: ignoré
+    return min(2 ** retries, CELERY_RETRY_BACKOFF_MAX)
+
+
+# ============================================================
+# LIMITES OPENAI (headers x-ratelimit-*, partagés entre workers)
+# ============================================================
+# OpenAI limite chaque modèle indépendamment, en requêtes (RPM) et en tokens
+# (TPM): un état par modèle et par dimension, expirant au reset annoncé.
+
+RATELIMIT_PREFIX = "ratelimit:openai:"
+RATELIMIT_KINDS = ("requests", "tokens")
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _parse_reset(value: str) -> float:
+    """Durée OpenAI ("1m30s", "250ms", "6s") → secondes."""
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in _DURATION_RE.findall(value))
+
+
+def _ratelimit_key(model: str, kind: str) -> str:
+    return f"{RATELIMIT_PREFIX}{model}:{kind}"
+
+
+def _estimate_tokens(completion_params: dict) -> int:
+    """Tokens décomptés par OpenAI pour le TPM: prompt (~4 caractères/token) + max de sortie."""
+    chars = 0
+    for message in completion_params.get("messages", ()):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text") or "") for part in content if isinstance(part, dict))
+    max_output = completion_params.get("max_completion_tokens") or completion_params.get("max_tokens") or 0
+    return (chars >> 2) + max_output
+
+
+class _Quota:
+    """Copie locale de l'état x-ratelimit d'un modèle (instants en time.monotonic)."""
+    
+    __slots__ = ("fetched_at", "requests", "requests_reset", "tokens", "tokens_reset")
+    
+    def __init__(self, fetched_at: float, requests, requests_reset: float, tokens, tokens_reset: float):
+        self.fetched_at = fetched_at
+        self.requests = requests
+        self.requests_reset = requests_reset
+        self.tokens = tokens
+        self.tokens_reset = tokens_reset
+
+
+# Cache local (par process worker) de l'état Redis: évite un aller-retour par tâche.
+# Décrémenté localement à chaque appel autorisé, rafraîchi après RATELIMIT_LOCAL_TTL.
+RATELIMIT_LOCAL_TTL = 1.0
+_local_quota: dict[str, _Quota] = {}
+_local_quota_lock = threading.Lock()
+
+
+def _record_ratelimit(redis_client, model: str, headers):
+    """Stocke requêtes et tokens restants annoncés par OpenAI pour ce modèle, jusqu'au reset."""
+    now = time.monotonic()
+    values = {}
+    pipe = redis_client.pipeline(transaction=False)
+    for kind in RATELIMIT_KINDS:
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        reset = headers.get(f"x-ratelimit-reset-{kind}")
+        if remaining is None or reset is None:
+            continue
+        try:
+            remaining, reset_s = int(remaining), _parse_reset(reset)
+        except ValueError as e:
+            logger.debug(f"x-ratelimit-{kind} illisible: {e}")
+            continue
+        values[kind] = (remaining, now + reset_s)
+        pipe.set(_ratelimit_key(model, kind), remaining, px=max(1, int(reset_s * 1000)))
+    
+    if not values:
+        return
+    # La réponse de ce worker est la donnée la plus fraîche: cache local à jour
+    requests, requests_reset = values.get("requests", (None, now))
+    tokens, tokens_reset = values.get("tokens", (None, now))
+    with _local_quota_lock:
+        _local_quota[model] = _Quota(now, requests, requests_reset, tokens, tokens_reset)
+    try:
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.debug(f"x-ratelimit non enregistré: {e}")
+
+
+def _fetch_quota(redis_client, model: str, now: float) -> _Quota:
+    """État partagé (tous workers) du modèle, en un aller-retour."""
+    pipe = redis_client.pipeline(transaction=False)
+    for kind in RATELIMIT_KINDS:
+        key = _ratelimit_key(model, kind)
+        pipe.get(key)
+        pipe.pttl(key)
+    requests, requests_pttl, tokens, tokens_pttl = pipe.execute()
+    return _Quota(
+        now,
+        int(requests) if requests is not None else None,
+        now + max(requests_pttl, 0) / 1000,
+        int(tokens) if tokens is not None else None,
+        now + max(tokens_pttl, 0) / 1000,
+    )
+
+
+def _ratelimit_wait(redis_client, model: str, tokens: int) -> float:
+    """Secondes avant reset si le modèle n'a plus de requête ou pas assez de tokens, sinon 0."""
+    now = time.monotonic()
+    with _local_quota_lock:
+        quota = _local_quota.get(model)
+    if quota is None or now - quota.fetched_at >= RATELIMIT_LOCAL_TTL:
+        quota = _fetch_quota(redis_client, model, now)
+    
+    with _local_quota_lock:
+        wait = 0.0
+        if quota.requests is not None and quota.requests < 1 and now < quota.requests_reset:
+            wait = quota.requests_reset - now
+        if quota.tokens is not None and quota.tokens < tokens and now < quota.tokens_reset:
+            wait = max(wait, quota.tokens_reset - now)
+        if not wait:
+            # Consommation estimée, jusqu'au prochain rafraîchissement
+            if quota.requests is not None:
+                quota.requests -= 1
+            if quota.tokens is not None:
+                quota.tokens -= tokens
+        _local_quota[model] = quota
+    return wait
+
+
+# ============================================================
+# STREAM DE SESSION (Redis Stream llm:stream:{session_id})
+# ============================================================
+# Une entrée par event: t = type (status/chunk/done/error), d = payload
+# (texte brut pour chunk, JSON sinon). Le stream reste lisible après coup:
+# un client SSE qui se connecte en retard rejoue depuis le début.
+
+STREAM_MAXLEN = 10000
+STREAM_TTL_ACTIVE = CELERY_TASK_TIME_LIMIT + 60  # Nettoyage si la tâche meurt
+STREAM_TTL_DONE = 300  # Reconnexions après la fin
+
+
+def _emit(redis_client, stream_key: str, kind: str, payload, ttl: int = STREAM_TTL_ACTIVE):
+    """Ajoute un event au stream de session et (re)pose son TTL, en un aller-retour."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xadd(stream_key, {"t": kind, "d": payload}, maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.expire(stream_key, ttl)
+    pipe.execute()
+
+
+# ============================================================
+# NOTIFICATION DE FIN (pub/sub)
+# ============================================================
+
+class NotifyingTask(Task):
+    """
+    Publie le résultat final sur llm:done:{task_id}.
+    
+    Le proxy s'abonne à ce channel au lieu de poller le result backend.
+    """
+    
+    def on_success(self, retval, task_id, args, kwargs):
+        _notify_done(task_id, {"task_id": task_id, "status": "SUCCESS", "result": retval})
+    
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        _notify_done(task_id, {"task_id": task_id, "status": "FAILURE", "error": str(exc)})
+
+
+def _notify_done(task_id: str, payload: dict):
+    try:
+        get_redis().publish(f"llm:done:{task_id}", orjson.dumps(payload))
+    except Exception as e:
+        # Le résultat reste disponible dans le backend Celery
+        logger.warning(f"Task {task_id}: notification de fin échouée: {e}")
+
+
 # ============================================================
 # TÂCHE PRINCIPALE: CHAT COMPLETION
 # ============================================================
 
 @shared_task(
     bind=True,
-    autoretry_for=(Exception,),
+    base=NotifyingTask,
+    autoretry_for=TRANSIENT_ERRORS,
     retry_backoff=True,
     retry_backoff_max=CELERY_RETRY_BACKOFF_MAX,
     retry_jitter=True,
     max_retries=CELERY_MAX_RETRIES,
     acks_late=True,
-    # Rate limit géré par Celery via task_annotations dans celery_app.py
+    # Rate limit natif Celery (par worker, en mémoire: aucun appel Redis)
+    rate_limit=CELERY_RATE_LIMIT,
 )
 def chat_completion(
     self,
     session_id: str,
     completion_params: dict,
+    quota_waits: int = 0,
 ) -> dict:
     """
     Tâche Celery pour chat completion.
     
     Accepte TOUS les paramètres OpenAI via completion_params (passés directement à l'API).
+    quota_waits compte les replanifications sur quota épuisé (interne).
     
     Paramètres supportés (tout ce que OpenAI supporte):
     - model, messages (requis)
@@ -94,14 +334,36 @@ def chat_completion(
     - modalities, audio, prediction
     - service_tier, etc.
     
-    Publie les chunks en temps réel sur Redis pub/sub.
-    Channel: llm:stream:{session_id}
+    Ajoute les events en temps réel au Redis Stream llm:stream:{session_id}
+    (champ t = type, champ d = payload):
+    - status  → JSON (started)
+    - chunk   → texte brut du delta (pas de JSON)
+    - done    → JSON {"type": "complete", ...}
+    - error   → JSON {"type": "error", ...}
     """
     redis_client = get_redis()
-    channel = f"llm:stream:{session_id}"
+    stream_key = f"llm:stream:{session_id}"
+    
+    # Appliquer le modèle par défaut si non spécifié
+    if "model" not in completion_params:
+        completion_params["model"] = OPENAI_DEFAULT_MODEL
+    
+    # Quota OpenAI du modèle épuisé: replanifier au reset plutôt qu'appeler pour un 429.
+    # Les attentes sont comptées dans quota_waits (plafonné), pas dans request.retries
+    # qui ne compte que les vrais échecs; au-delà du plafond, l'appel part et un 429
+    # éventuel suit le retry normal.
+    if quota_waits < CELERY_MAX_QUOTA_WAITS:
+        wait = _ratelimit_wait(redis_client, completion_params["model"], _estimate_tokens(completion_params))
+        if wait:
+            self.signature_from_request(
+                kwargs={**self.request.kwargs, "quota_waits": quota_waits + 1},
+                countdown=wait,
+                retries=self.request.retries,
+            ).apply_async()
+            raise Ignore()
     
     # Publie le statut "started"
-    redis_client.publish(channel, json.dumps({
+    _emit(redis_client, stream_key, "status", orjson.dumps({
         "type": "status",
         "status": "started",
         "task_id": self.request.id
@@ -110,32 +372,46 @@ def chat_completion(
     try:
         client = get_openai()
         
-        # Appliquer le modèle par défaut si non spécifié
-        if "model" not in completion_params:
-            completion_params["model"] = OPENAI_DEFAULT_MODEL
-        
         # Extraire stream pour la logique interne
         stream = completion_params.get("stream", False)
         
         if stream:
-            return _stream_completion(client, completion_params, session_id, channel, redis_client)
+            return _stream_completion(client, completion_params, session_id, stream_key, redis_client)
         else:
-            return _sync_completion(client, completion_params, session_id, channel, redis_client)
+            return _sync_completion(client, completion_params, session_id, stream_key, redis_client, self.request.id)
             
+    except RateLimitError as e:
+        # 429: replanifie après le délai du serveur, le slot worker est libéré entre-temps
+        if self.request.retries < self.max_retries:
+            countdown = _retry_after(e, self.request.retries)
+            logger.info(f"Task {session_id} rate limited, retry dans {countdown:.2f}s")
+            raise self.retry(exc=e, countdown=countdown)
+        logger.error(f"Task {session_id} failed: {e}")
+        _emit(redis_client, stream_key, "error", orjson.dumps({
+            "type": "error",
+            "error": str(e)
+        }), ttl=STREAM_TTL_DONE)
+        raise
+        
     except SoftTimeLimitExceeded:
         logger.warning(f"Task {session_id} timeout")
-        redis_client.publish(channel, json.dumps({
+        _emit(redis_client, stream_key, "error", orjson.dumps({
             "type": "error",
             "error": "Timeout: la requête a pris trop de temps"
-        }))
+        }), ttl=STREAM_TTL_DONE)
         raise
         
     except Exception as e:
+        # Erreur transitoire avec retry restant: l'autoretry Celery relance la
+        # tâche, pas d'event de fin (le hub s'y arrêterait avant la réponse)
+        if isinstance(e, TRANSIENT_ERRORS) and self.request.retries < self.max_retries:
+            logger.warning(f"Task {session_id}: erreur transitoire, retry: {e}")
+            raise
         logger.error(f"Task {session_id} failed: {e}")
-        redis_client.publish(channel, json.dumps({
+        _emit(redis_client, stream_key, "error", orjson.dumps({
             "type": "error",
             "error": str(e)
-        }))
+        }), ttl=STREAM_TTL_DONE)
         raise
 
 
@@ -143,33 +419,63 @@ def chat_completion(
 # COMPLETION STREAMING
 # ============================================================
 
-def _stream_completion(client: OpenAI, completion_params: dict, session_id: str, channel: str, redis_client) -> dict:
+def _stream_completion(client: OpenAI, completion_params: dict, session_id: str, stream_key: str, redis_client) -> dict:
     """
-    Streaming completion avec publication Redis.
+    Streaming completion avec publication dans le Redis Stream de la session.
     
     Passe TOUS les paramètres OpenAI directement à l'API.
     """
     model = completion_params.get("model", OPENAI_DEFAULT_MODEL)
-    stream = client.chat.completions.create(**completion_params)
+    raw = client.chat.completions.with_raw_response.create(**completion_params)
+    _record_ratelimit(redis_client, model, raw.headers)
+    stream = raw.parse()
     
     full_response = ""
     chunks_count = 0
     
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta.content:
-            content = chunk.choices[0].delta.content
-            full_response += content
-            chunks_count += 1
-            redis_client.publish(channel, json.dumps({
-                "type": "chunk",
-                "content": content,
-                "index": chunks_count
-            }))
-    
-    redis_client.publish(channel, json.dumps({
+    # Deltas adjacents fusionnés en une entrée (moins de commandes Redis pour
+    # des tokens d'un ou deux caractères), publiés hors de la boucle de lecture OpenAI
+    pending = []
+    pending_chars = 0
+    flush_after = STREAM_PUBLISH_MS / 1000
+    last_flush = time.monotonic()
+    publisher = _ChunkPublisher(redis_client, stream_key)
+    error = None
+    
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content = chunk.choices[0].delta.content
+                full_response += content
+                chunks_count += 1
+                pending.append(content)
+                pending_chars += len(content)
+                
+                now = time.monotonic()
+                if pending_chars >= STREAM_PUBLISH_MIN_CHARS or now - last_flush >= flush_after:
+                    publisher.put(["".join(pending)])
+                    pending = []
+                    pending_chars = 0
+                    last_flush = now
+        
+        if pending:
+            publisher.put(["".join(pending)])
+    except Exception as e:
+        error = e
+    finally:
+        publisher.close()
+    
+    error = error or publisher.error
+    if error is not None:
+        # Deltas déjà dans le stream de session: un retry les dupliquerait
+        if publisher.published and isinstance(error, TRANSIENT_ERRORS):
+            raise StreamInterrupted(f"Stream interrompu après {publisher.published} deltas: {error}") from error
+        raise error
+    
+    _emit(redis_client, stream_key, "done", orjson.dumps({
         "type": "complete",
         "total_chunks": chunks_count
-    }))
+    }), ttl=STREAM_TTL_DONE)
     
     logger.info(f"Session {session_id}: {len(full_response)} chars, {chunks_count} chunks")
     
@@ -181,25 +487,97 @@ def _stream_completion(client: OpenAI, completion_params: dict, session_id: str,
     }
 
 
+def _publish_chunks(redis_client, stream_key: str, chunks: list):
+    """Ajoute les deltas au stream en un seul pipeline (ordre conservé)."""
+    pipe = redis_client.pipeline(transaction=False)
+    for content in chunks:
+        pipe.xadd(stream_key, {"t": "chunk", "d": content}, maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.execute()
+
+
+class _ChunkPublisher:
+    """
+    Publie les lots de deltas depuis un thread dédié (greenlet sous gevent).
+    
+    La lecture du stream OpenAI ne bloque plus sur Redis; les lots accumulés
+    pendant un pipeline partent ensemble dans le suivant. Queue bornée: si Redis
+    ralentit, la lecture attend (pas de perte, le stream de session est rejouable).
+    """
+    
+    def __init__(self, redis_client, stream_key: str, maxsize: int = 256):
+        self.redis_client = redis_client
+        self.stream_key = stream_key
+        self.error: Optional[Exception] = None
+        self.published = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def put(self, chunks: list):
+        self._queue.put(chunks)
+    
+    def close(self):
+        """Attend la publication des lots en attente."""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            stop = False
+            while True:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                batch.extend(more)
+            # Après une erreur, on vide la queue sans publier (la tâche échouera)
+            if self.error is None:
+                try:
+                    _publish_chunks(self.redis_client, self.stream_key, batch)
+                    self.published += len(batch)
+                except Exception as e:
+                    self.error = e
+            if stop:
+                return
+
+
 # ============================================================
 # COMPLETION SYNCHRONE
 # ============================================================
 
-def _sync_completion(client: OpenAI, completion_params: dict, session_id: str, channel: str, redis_client) -> dict:
+# Réponse OpenAI brute, lue par le proxy juste après la notification de fin
+RAW_RESPONSE_PREFIX = "llm:raw:"
+RAW_RESPONSE_TTL = 60
+
+def _sync_completion(client: OpenAI, completion_params: dict, session_id: str, stream_key: str, redis_client, task_id: str) -> dict:
     """
     Completion synchrone.
     
     Passe TOUS les paramètres OpenAI directement à l'API.
+    
+    Le JSON brut de la réponse OpenAI (tool_calls, refusal, etc.) est stocké tel quel
+    sous llm:raw:{task_id} (TTL court) pour le proxy, hors du résultat Celery.
     """
     model = completion_params.get("model", OPENAI_DEFAULT_MODEL)
-    response = client.chat.completions.create(**completion_params)
+    raw = client.chat.completions.with_raw_response.create(**completion_params)
+    _record_ratelimit(redis_client, model, raw.headers)
+    response = raw.parse()
+    
+    # Octets HTTP bruts: pas de model_dump ni de re-sérialisation
+    redis_client.set(f"{RAW_RESPONSE_PREFIX}{task_id}", raw.http_response.content, ex=RAW_RESPONSE_TTL)
     
     content = response.choices[0].message.content
     
-    redis_client.publish(channel, json.dumps({
+    _emit(redis_client, stream_key, "done", orjson.dumps({
         "type": "complete",
         "content": content
-    }))
+    }), ttl=STREAM_TTL_DONE)
     
     # Construire usage si disponible
     usage = None
@@ -222,8 +600,6 @@ def _sync_completion(client: OpenAI, completion_params: dict, session_id: str, c
         "response": content,
         "model": model,
         "usage": usage,
-        # Retourner la réponse complète pour accès aux métadonnées (tool_calls, etc.)
-        "full_response": response.model_dump()
     }
 
 
@@ -233,16 +609,19 @@ def _sync_completion(client: OpenAI, completion_params: dict, session_id: str, c
 
 @shared_task(
     bind=True,
-    autoretry_for=(Exception,),
+    autoretry_for=TRANSIENT_ERRORS,
     retry_backoff=True,
     retry_backoff_max=CELERY_RETRY_BACKOFF_MAX,
     max_retries=CELERY_MAX_RETRIES,
-    # Rate limit géré par Celery via task_annotations dans celery_app.py
+    rate_limit=CELERY_RATE_LIMIT,
+    # Tâche courte et idempotente: ack dès la réception (queue "fast")
+    acks_late=False,
 )
 def batch_embeddings(
     self,
     texts: list[str],
     model: str = "text-embedding-3-small",
+    encoding_format: str = "float",
 ) -> dict:
     """
     Génère des embeddings en batch.
@@ -250,21 +629,41 @@ def batch_embeddings(
     Args:
         texts: Liste de textes à encoder (max 100)
         model: Modèle d'embedding (text-embedding-3-small, text-embedding-3-large, etc.)
+        encoding_format: "float" (listes de floats) ou "base64" (un seul blob float32)
     
     Returns:
-        dict avec embeddings, model, count, dimensions
+        dict avec embeddings (ou embeddings_b64 + shape), model, count, dimensions
+    
+    En base64, les vecteurs float32 renvoyés par OpenAI sont concaténés sans
+    passer par des floats Python. Côté client:
+        np.frombuffer(base64.b64decode(s), dtype=np.float32).reshape(shape)
     """
     client = get_openai()
-    response = client.embeddings.create(model=model, input=texts)
-    embeddings = [item.embedding for item in response.data]
     
-    logger.info(f"Embeddings: {len(embeddings)} texts, model: {model}")
+    if encoding_format == "base64":
+        response = client.embeddings.create(model=model, input=texts, encoding_format="base64")
+        blob = b"".join(base64.b64decode(item.embedding) for item in response.data)
+        count = len(response.data)
+        dimensions = len(blob) // (4 * count) if count else 0
+        result = {
+            "embeddings_b64": base64.b64encode(blob).decode("ascii"),
+            "dtype": "float32",
+            "shape": [count, dimensions],
+        }
+    else:
+        response = client.embeddings.create(model=model, input=texts)
+        embeddings = [item.embedding for item in response.data]
+        count = len(embeddings)
+        dimensions = len(embeddings[0]) if embeddings else 0
+        result = {"embeddings": embeddings}
+    
+    logger.info(f"Embeddings: {count} texts, model: {model}")
     
     return {
-        "embeddings": embeddings,
+        **result,
         "model": model,
-        "count": len(embeddings),
-        "dimensions": len(embeddings[0]) if embeddings else 0,
+        "count": count,
+        "dimensions": dimensions,
         "usage": {
             "prompt_tokens": response.usage.prompt_tokens,
             "total_tokens": response.usage.total_tokens,
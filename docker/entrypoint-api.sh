@@ -16,7 +16,9 @@ echo "========================================"
 exec uvicorn app.api.main:app \
     --host 0.0.0.0 \
     --port ${PORT:-8007} \
-    --workers ${UVICORN_WORKERS:-4}
+    --workers ${UVICORN_WORKERS:-4} \
+    --loop uvloop \
+    --http httptools
 
 
 
@@ -11,6 +11,7 @@ echo "========================================"
 echo "  Pool:            ${CELERY_POOL:-gevent}"
 echo "  Concurrency:     ${CELERY_CONCURRENCY:-100}"
 echo "  Queues:          ${CELERY_QUEUES:-high,default,low}"
+echo "  Prefetch:        ${CELERY_PREFETCH_MULTIPLIER:-1}"
 echo "  Loglevel:        ${CELERY_LOGLEVEL:-info}"
 echo "  Redis:           ${REDIS_URL:-redis://localhost:6379/0}"
 echo "========================================"
@@ -20,4 +21,7 @@ exec celery -A app.celery_app worker \
     --loglevel=${CELERY_LOGLEVEL:-info} \
     --concurrency=${CELERY_CONCURRENCY:-100} \
     --queues=${CELERY_QUEUES:-high,default,low} \
-    --hostname=worker@%h
+    --hostname=worker@%h \
+    -O fair \
+    --without-mingle \
+    --without-gossip
@@ -163,6 +163,20 @@ test_api() {
     echo ""
 }
 
+pytest_api() {
+    log_info "Tests pytest de l'API (parallèles, xdist)..."
+    
+    # Vérifier/installer les dépendances de test
+    if ! python -c "import pytest_asyncio, xdist, h2" 2>/dev/null; then
+        log_warn "Installation des dépendances de test..."
+        pip install pytest pytest-asyncio pytest-xdist "httpx[http2]" orjson redis
+    fi
+    
+    # Les groupes xdist_group("server_load") restent sur un seul worker.
+    # Le test de charge (test_load_monitoring) reste en série: ./run.sh loadtest
+    python -m pytest tests --ignore=tests/test_load_monitoring.py -n auto --dist=loadgroup "$@"
+}
+
 clean() {
     log_info "Nettoyage complet..."
     dc down -v --rmi all 2>/dev/null || true
@@ -184,6 +198,7 @@ usage() {
     echo "  scale <n>     Scale les workers Celery"
     echo "  monitoring    Démarre avec Flower (port 5555)"
     echo "  test          Test les endpoints API"
+    echo "  pytest        Tests pytest de l'API en parallèle (xdist)"
     echo "  loadtest      Test de charge avec monitoring Docker"
     echo "  build         Build les images"
     echo "  clean         Supprime tout (containers, volumes, images)"
@@ -206,7 +221,7 @@ loadtest() {
     # Vérifier/installer les dépendances de test
     if ! python -c "import pytest_asyncio" 2>/dev/null; then
         log_warn "Installation des dépendances de test..."
-        pip install pytest pytest-asyncio httpx docker
+        pip install pytest pytest-asyncio "httpx[http2]" orjson docker
     fi
     
     # Lancer les tests (depuis l'hôte, appelle l'API Docker)
@@ -235,6 +250,7 @@ case "${1:-}" in
     scale)        scale "$@" ;;
     monitoring)   monitoring ;;
     test)         test_api ;;
+    pytest)       shift; pytest_api "$@" ;;
     loadtest)     shift; loadtest "$@" ;;
     build)        build ;;
     clean)        clean ;;
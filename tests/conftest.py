@@ -1,8 +1,55 @@
 """Configuration pytest pour les tests async."""
+import httpx
 import pytest
+import pytest_asyncio
 
 # Configure pytest-asyncio
 pytest_plugins = ('pytest_asyncio',)
 
+# Configuration
+API_URL = "http://localhost:8007"
+TIMEOUT = 120.0
 
+# Un pool de connexions pour toute la session (pas de handshake TCP par requête)
+LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
 
+
+@pytest.fixture(scope="session")
+def client():
+    """Client HTTP synchrone partagé par tous les tests."""
+    with httpx.Client(base_url=API_URL, timeout=10, limits=LIMITS) as c:
+        yield c
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def async_client():
+    """
+    Client HTTP async partagé.
+
+    Lié à la boucle de session: les tests qui l'utilisent doivent être
+    marqués @pytest.mark.asyncio(loop_scope="session").
+    http2=True n'a d'effet que si API_URL pointe vers un proxy TLS parlant
+    HTTP/2: uvicorn sert du HTTP/1.1 en clair (pas de h2c), httpx y reste en
+    HTTP/1.1. Requiert h2 (httpx[http2], dans requirements.txt).
+    """
+    async with httpx.AsyncClient(base_url=API_URL, timeout=TIMEOUT, limits=LIMITS, http2=True) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def get_json(client):
+    """
+    GET JSON mis en cache par chemin pour toute la session (sondes /health, /stats).
+
+    refresh=True force un nouvel appel (après un test qui modifie l'état).
+    """
+    cache = {}
+
+    def _get(path: str, refresh: bool = False) -> dict:
+        if refresh or path not in cache:
+            response = client.get(path, timeout=5)
+            response.raise_for_status()
+            cache[path] = response.json()
+        return cache[path]
+
+    return _get
@@ -9,32 +9,154 @@ Prérequis:
     ./run.sh start
 """
 import asyncio
-import json
+import os
+import re
+import statistics
 import time
+import orjson
 import pytest
-import httpx
+import pytest_asyncio
 
-# Configuration
-API_URL = "http://localhost:8007"
-TIMEOUT = 120.0
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# Redis de l'API (chemin optionnel: lecture directe des streams de session)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Requêtes en vol max pendant les bursts
+BURST_CONCURRENCY = 32
+
+# Event de fin du stream SSE, détecté sur les octets bruts
+_TERMINAL = re.compile(rb'"type"\s*:\s*"(?:complete|error|timeout)"')
+
+
+async def iter_sse_events(stream):
+    """
+    Events SSE décodés, lus en octets bruts (aiter_raw) au fil des blocs reçus
+    du réseau (sans chunk_size: httpx attendrait d'en avoir accumulé autant).
+    
+    Les frames complètes (b"\n\n") du buffer sont parcourues par offsets et
+    les payloads data: passés à orjson en memoryview (ni décodage utf-8 ni
+    copie par ligne); le buffer n'est compacté qu'une fois par bloc reçu.
+    Les lignes data: non JSON sont ignorées. S'arrête après l'event terminal
+    (complete, error ou timeout).
+    """
+    buf = bytearray()
+    async for chunk in stream.aiter_raw():
+        buf += chunk
+        start = 0
+        with memoryview(buf) as view:
+            while (end := buf.find(b"\n\n", start)) != -1:
+                pos = start
+                while pos < end:
+                    eol = buf.find(b"\n", pos, end)
+                    if eol == -1:
+                        eol = end
+                    if buf.startswith(b"data:", pos, eol):
+                        try:
+                            event = orjson.loads(view[pos + 5:eol])
+                        except orjson.JSONDecodeError:
+                            event = None
+                        if event is not None:
+                            yield event
+                            if _TERMINAL.search(buf, pos, eol):
+                                return
+                    pos = eol + 1
+                start = end + 2
+        del buf[:start]
+
+
+class SessionStreamBus:
+    """
+    Lit les streams llm:stream:{session_id} de toutes les sessions sur une
+    seule connexion Redis (XREAD multi-clés), au lieu d'une connexion SSE
+    par requête. Les events sont redistribués dans une queue par session,
+    au format des events SSE.
+    """
+    
+    def __init__(self, redis):
+        self.redis = redis
+        self.queues: dict[str, asyncio.Queue] = {}
+        self._last_ids: dict[str, bytes] = {}
+        self._reader = asyncio.create_task(self._run())
+    
+    def watch(self, session_id: str) -> asyncio.Queue:
+        key = f"llm:stream:{session_id}"
+        self.queues[key] = asyncio.Queue()
+        # Lecture depuis le début: rien n'est perdu si le worker a déjà écrit
+        self._last_ids[key] = b"0"
+        return self.queues[key]
+    
+    async def close(self):
+        self._reader.cancel()
+        try:
+            await self._reader
+        except asyncio.CancelledError:
+            pass
+    
+    async def _run(self):
+        while True:
+            if not self._last_ids:
+                await asyncio.sleep(0.01)
+                continue
+            # Block court: les sessions ajoutées entre-temps sont prises au tour suivant
+            result = await self.redis.xread(dict(self._last_ids), count=256, block=100)
+            for key, entries in result or ():
+                key = key.decode()
+                for entry_id, fields in entries:
+                    self._last_ids[key] = entry_id
+                    kind, data = fields[b"t"], fields[b"d"]
+                    if kind == b"chunk":
+                        event = {"type": "chunk", "content": data.decode("utf-8")}
+                    else:
+                        event = orjson.loads(data)
+                    self.queues[key].put_nowait(event)
+                    if kind in (b"done", b"error"):
+                        del self._last_ids[key]
+
+
+@pytest.fixture(params=[False, True], ids=["sse", "redis-bus"])
+def use_redis_bus(request) -> bool:
+    return request.param
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def session_bus(use_redis_bus):
+    """SessionStreamBus si demandé et Redis joignable, sinon None (chemin SSE)."""
+    if not use_redis_bus:
+        yield None
+        return
+    if aioredis is None:
+        pytest.skip("redis non installé")
+    
+    redis = aioredis.from_url(REDIS_URL)
+    try:
+        await redis.ping()
+    except Exception as e:
+        await redis.aclose()
+        pytest.skip(f"Redis non joignable ({REDIS_URL}): {e}")
+    
+    bus = SessionStreamBus(redis)
+    yield bus
+    await bus.close()
+    await redis.aclose()
 
 
 class TestHealthCheckCelery:
     """Tests de santé pour le mode Celery."""
     
-    def test_health(self):
+    def test_health(self, get_json):
         """Vérifie que l'API répond."""
-        response = httpx.get(f"{API_URL}/health", timeout=10)
-        assert response.status_code == 200
-        data = response.json()
+        data = get_json("/health")
         assert data["status"] == "ok"
         assert data.get("backend") == "celery+redis", "Pas en mode Celery"
         print(f"\n✓ API OK (backend: {data.get('backend')})")
     
-    def test_health_full(self):
+    def test_health_full(self, get_json):
         """Vérifie Redis et Celery workers."""
-        response = httpx.get(f"{API_URL}/health/full", timeout=10)
-        data = response.json()
+        data = get_json("/health/full")
         
         print(f"\n  Redis: {data.get('redis')}")
         print(f"  Celery: {data.get('celery_workers')}")
@@ -48,15 +170,22 @@ class TestHealthCheckCelery:
 class TestCeleryAsync:
     """Tests du mode asynchrone Celery."""
     
-    def test_chat_async_returns_task_id(self):
-        """Vérifie que /chat retourne un task_id Celery."""
+    # fire_and_forget: borne < 1s et endpoint de status (vérifiés sur /chat simple)
+    @pytest.mark.parametrize("endpoint,payload,fire_and_forget", [
+        pytest.param("/chat", {"message": "Dis juste OK"}, True, id="chat"),
+        pytest.param("/chat", {"message": "Urgent", "priority": 10}, False, id="chat-priority-high"),
+        pytest.param("/chat", {"message": "Pas urgent", "priority": -10}, False, id="chat-priority-low"),
+        pytest.param("/embeddings", {"texts": ["Hello", "World"]}, False, id="embeddings"),
+    ])
+    def test_submit_returns_task_id(self, client, endpoint, payload, fire_and_forget):
+        """
+        Soumission: /chat (avec ou sans priorité) et /embeddings retournent un
+        task_id Celery; /chat simple répond en moins d'1s et son status est
+        consultable via /chat/{task_id}.
+        """
         start = time.time()
         
-        response = httpx.post(
-            f"{API_URL}/chat",
-            json={"message": "Dis juste OK"},
-            timeout=10
-        )
+        response = client.post(endpoint, json=payload)
         
         elapsed = time.time() - start
         
@@ -66,111 +195,78 @@ class TestCeleryAsync:
         # Vérifie la structure de réponse Celery
         assert data["status"] == "queued"
         assert "task_id" in data, "Manque task_id (spécifique Celery)"
-        assert "session_id" in data
-        assert "stream_url" in data
+        if endpoint == "/chat":
+            assert "session_id" in data
+            assert "stream_url" in data
+        
+        print(f"\n✓ {endpoint} en {elapsed*1000:.0f}ms")
+        print(f"  task_id: {data['task_id']}")
+        
+        if not fire_and_forget:
+            return
         
         # Doit retourner en moins de 1 seconde (fire-and-forget)
         assert elapsed < 1.0, f"Trop lent: {elapsed:.2f}s (devrait être < 1s)"
         
-        print(f"\n✓ Réponse en {elapsed*1000:.0f}ms")
-        print(f"  task_id: {data['task_id']}")
-        print(f"  session_id: {data['session_id']}")
-    
-    def test_task_status_endpoint(self):
-        """Vérifie l'endpoint de status des tâches Celery."""
-        # Crée une tâche
-        response = httpx.post(
-            f"{API_URL}/chat",
-            json={"message": "Test status"},
-            timeout=10
-        )
-        data = response.json()
-        task_id = data["task_id"]
-        
         # Vérifie le status
-        status_resp = httpx.get(f"{API_URL}/chat/{task_id}", timeout=10)
-        status_data = status_resp.json()
-        
+        task_id = data["task_id"]
+        status_data = client.get(f"/chat/{task_id}").json()
         assert "status" in status_data
         assert status_data["task_id"] == task_id
         
-        print(f"\n✓ Task status: {status_data['status']}")
-    
-    def test_priority_queues(self):
-        """Vérifie que les priorités sont acceptées."""
-        # Priorité haute
-        resp_high = httpx.post(
-            f"{API_URL}/chat",
-            json={"message": "Urgent", "priority": 10},
-            timeout=10
-        )
-        assert resp_high.status_code == 200
-        
-        # Priorité basse
-        resp_low = httpx.post(
-            f"{API_URL}/chat",
-            json={"message": "Pas urgent", "priority": -10},
-            timeout=10
-        )
-        assert resp_low.status_code == 200
-        
-        print("\n✓ Priorités high/low acceptées")
+        print(f"  status: {status_data['status']}")
 
 
 class TestCeleryStreaming:
     """Tests du streaming via Redis pub/sub."""
     
-    @pytest.mark.asyncio
-    async def test_stream_receives_chunks(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_stream_receives_chunks(self, async_client):
         """Vérifie que le stream SSE reçoit les chunks depuis Redis."""
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            # Envoie la requête
-            resp = await client.post(
-                f"{API_URL}/chat",
-                json={"message": "Compte de 1 à 3"}
-            )
-            data = resp.json()
-            session_id = data["session_id"]
-            
-            print(f"\n  Session: {session_id}")
-            print(f"  Task: {data['task_id']}")
-            
-            # Écoute le stream
-            chunks = []
-            full_content = ""
-            
-            async with client.stream("GET", f"{API_URL}/stream/{session_id}") as stream:
-                async for line in stream.aiter_lines():
-                    if line.startswith("data:"):
-                        try:
-                            event_data = json.loads(line[5:].strip())
-                            chunks.append(event_data)
-                            
-                            # Celery envoie "content" pour les chunks
-                            if "content" in event_data:
-                                full_content += event_data["content"]
-                                print(f"  chunk: {event_data['content'][:20]}...")
-                            
-                            # Fin du stream
-                            if event_data.get("type") in ("complete", "error", "timeout"):
-                                print(f"  → {event_data['type']}")
-                                break
-                        except json.JSONDecodeError:
-                            pass
-            
-            assert len(chunks) >= 1, "Devrait recevoir au moins 1 event"
-            print(f"\n✓ Reçu {len(chunks)} events, {len(full_content)} chars")
+        # Envoie la requête
+        resp = await async_client.post(
+            "/chat",
+            json={"message": "Compte de 1 à 3"}
+        )
+        data = resp.json()
+        session_id = data["session_id"]
+        
+        print(f"\n  Session: {session_id}")
+        print(f"  Task: {data['task_id']}")
+        
+        # Écoute le stream
+        chunks = []
+        full_content = ""
+        
+        async with async_client.stream("GET", f"/stream/{session_id}") as stream:
+            async for event_data in iter_sse_events(stream):
+                chunks.append(event_data)
+                
+                # Celery envoie "content" pour les chunks
+                if "content" in event_data:
+                    full_content += event_data["content"]
+                    print(f"  chunk: {event_data['content'][:20]}...")
+        
+        # Fin du stream (dernier event)
+        if chunks:
+            print(f"  → {chunks[-1].get('type')}")
+        
+        assert len(chunks) >= 1, "Devrait recevoir au moins 1 event"
+        print(f"\n✓ Reçu {len(chunks)} events, {len(full_content)} chars")
 
 
+@pytest.mark.xdist_group("server_load")
 class TestCeleryParallel:
     """Tests de traitement parallèle avec Celery."""
     
-    @pytest.mark.asyncio
-    async def test_parallel_5_requests(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_parallel_5_requests(self, async_client, session_bus):
         """
         DÉMO: 5 requêtes envoyées simultanément via Celery.
         
         Celery distribue les tâches aux workers disponibles.
+        Variante redis-bus: réponses lues directement dans Redis sur une seule
+        connexion, sans un stream SSE par requête.
         """
         NUM_REQUESTS = 5
         messages = [f"Dis juste le chiffre {i}" for i in range(1, NUM_REQUESTS + 1)]
@@ -179,146 +275,132 @@ class TestCeleryParallel:
         print(f"  TEST CELERY: {NUM_REQUESTS} requêtes en parallèle")
         print(f"{'='*50}")
         
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            start_total = time.time()
-            
-            async def send_and_wait(msg: str, index: int):
-                start = time.time()
-                
-                # 1. Envoie (fire-and-forget)
-                resp = await client.post(
-                    f"{API_URL}/chat",
-                    json={"message": msg}
-                )
-                data = resp.json()
-                session_id = data["session_id"]
-                task_id = data["task_id"]
-                queue_time = time.time() - start
-                
-                # 2. Attend la réponse via SSE Redis
-                result = ""
-                async with client.stream("GET", f"{API_URL}/stream/{session_id}") as stream:
-                    async for line in stream.aiter_lines():
-                        if line.startswith("data:"):
-                            try:
-                                event = json.loads(line[5:].strip())
-                                if "content" in event:
-                                    result += event["content"]
-                                if event.get("type") in ("complete", "error", "timeout"):
-                                    break
-                            except:
-                                pass
-                
-                elapsed = time.time() - start
-                print(f"  Req #{index}: {elapsed:.2f}s | Queue: {queue_time*1000:.0f}ms | {result[:30]}...")
-                return elapsed
-            
-            # Lance toutes les requêtes en parallèle
-            tasks = [send_and_wait(msg, i+1) for i, msg in enumerate(messages)]
-            times = await asyncio.gather(*tasks)
-            
-            total_time = time.time() - start_total
-            avg_time = sum(times) / len(times)
-            sequential_estimate = sum(times)
-            
-            print(f"\n{'='*50}")
-            print(f"  RÉSULTATS CELERY")
-            print(f"{'='*50}")
-            print(f"  Temps total:        {total_time:.2f}s")
-            print(f"  Temps moyen/req:    {avg_time:.2f}s")
-            print(f"  Si séquentiel:      {sequential_estimate:.2f}s")
-            print(f"  Gain parallélisme:  {sequential_estimate/total_time:.1f}x")
-            print(f"{'='*50}")
+        start_total = time.time()
+        
+        async def send_and_wait(msg: str, index: int):
+            start = time.time()
             
-            # Vérifie le parallélisme
-            parallelism_ratio = sequential_estimate / total_time
+            # 1. Envoie (fire-and-forget)
+            resp = await async_client.post(
+                "/chat",
+                json={"message": msg}
+            )
+            data = resp.json()
+            session_id = data["session_id"]
+            task_id = data["task_id"]
+            queue_time = time.time() - start
             
-            assert parallelism_ratio > 1.5, \
-                f"Pas assez parallèle: ratio={parallelism_ratio:.1f}x"
+            # 2. Attend la réponse via SSE Redis (ou le bus partagé)
+            result = ""
+            if session_bus is not None:
+                queue = session_bus.watch(session_id)
+                while True:
+                    event = await asyncio.wait_for(queue.get(), async_client.timeout.read)
+                    if "content" in event:
+                        result += event["content"]
+                    if event.get("type") in ("complete", "error"):
+                        break
+            else:
+                async with async_client.stream("GET", f"/stream/{session_id}") as stream:
+                    async for event in iter_sse_events(stream):
+                        if "content" in event:
+                            result += event["content"]
             
-            print(f"\n✓ Parallélisme Celery: {parallelism_ratio:.1f}x plus rapide!")
+            elapsed = time.time() - start
+            print(f"  Req #{index}: {elapsed:.2f}s | Queue: {queue_time*1000:.0f}ms | {result[:30]}...")
+            return elapsed
+        
+        # Lance toutes les requêtes en parallèle
+        tasks = [send_and_wait(msg, i+1) for i, msg in enumerate(messages)]
+        times = await asyncio.gather(*tasks)
+        
+        total_time = time.time() - start_total
+        avg_time = sum(times) / len(times)
+        sequential_estimate = sum(times)
+        
+        print(f"\n{'='*50}")
+        print(f"  RÉSULTATS CELERY")
+        print(f"{'='*50}")
+        print(f"  Temps total:        {total_time:.2f}s")
+        print(f"  Temps moyen/req:    {avg_time:.2f}s")
+        print(f"  Si séquentiel:      {sequential_estimate:.2f}s")
+        print(f"  Gain parallélisme:  {sequential_estimate/total_time:.1f}x")
+        print(f"{'='*50}")
+        
+        # Vérifie le parallélisme
+        parallelism_ratio = sequential_estimate / total_time
+        
+        assert parallelism_ratio > 1.5, \
+            f"Pas assez parallèle: ratio={parallelism_ratio:.1f}x"
+        
+        print(f"\n✓ Parallélisme Celery: {parallelism_ratio:.1f}x plus rapide!")
 
 
+@pytest.mark.xdist_group("server_load")
 class TestCeleryRateLimiting:
     """Tests du rate limiting Celery."""
     
-    @pytest.mark.asyncio
-    async def test_burst_requests(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    @pytest.mark.parametrize("num_requests,waves", [(5, 3), (10, 3)])
+    async def test_burst_requests(self, async_client, num_requests, waves):
         """
-        Test de burst: envoie plusieurs requêtes rapidement.
+        Test de burst: envoie plusieurs vagues de requêtes rapidement.
         Celery doit les absorber sans erreur.
-        """
-        NUM_REQUESTS = 10
         
+        La première vague sert de warm-up (pool de connexions, batcher) et
+        n'entre pas dans la mesure: on vérifie la médiane des suivantes.
+        """
         print(f"\n{'='*50}")
-        print(f"  BURST TEST CELERY: {NUM_REQUESTS} requêtes")
+        print(f"  BURST TEST CELERY: {waves} vagues de {num_requests} requêtes")
         print(f"{'='*50}")
         
-        async with httpx.AsyncClient(timeout=30) as client:
-            start = time.time()
-            
-            async def quick_send(i: int):
-                resp = await client.post(
-                    f"{API_URL}/chat",
+        # Envois bornés: pas plus de requêtes en vol que de connexions du pool
+        sem = asyncio.Semaphore(BURST_CONCURRENCY)
+        
+        async def quick_send(i: int):
+            async with sem:
+                resp = await async_client.post(
+                    "/chat",
                     json={"message": f"Burst test {i}"}
                 )
-                return resp.json()
-            
-            tasks = [quick_send(i) for i in range(NUM_REQUESTS)]
-            results = await asyncio.gather(*tasks)
-            
+            return resp.json()
+        
+        wave_times = []
+        for wave in range(waves):
+            start = time.time()
+            results = await asyncio.gather(*[quick_send(i) for i in range(num_requests)])
             queue_time = time.time() - start
+            wave_times.append(queue_time)
             
             # Vérifie que toutes ont été acceptées
             task_ids = [r["task_id"] for r in results]
-            session_ids = [r["session_id"] for r in results]
+            assert len(task_ids) == num_requests
             
-            print(f"  {NUM_REQUESTS} requêtes en queue en {queue_time*1000:.0f}ms")
-            print(f"  Tasks créées: {len(task_ids)}")
-            
-            assert len(task_ids) == NUM_REQUESTS
-            assert queue_time < 3.0, f"Trop lent: {queue_time:.2f}s"
-            
-            print(f"\n✓ Burst absorbé par Celery!")
+            label = " (warm-up)" if wave == 0 else ""
+            print(f"  Vague {wave + 1}: {num_requests} requêtes en queue en {queue_time*1000:.0f}ms{label}")
+        
+        queue_time = statistics.median(wave_times[1:])
+        print(f"  Médiane (hors warm-up): {queue_time*1000:.0f}ms")
+        
+        assert queue_time < 3.0, f"Trop lent: {queue_time:.2f}s"
+        
+        print(f"\n✓ Burst absorbé par Celery!")
 
 
 class TestCeleryStats:
     """Tests des statistiques Celery."""
     
-    @pytest.mark.asyncio
-    async def test_stats_endpoint(self):
+    def test_stats_endpoint(self, get_json):
         """Vérifie l'endpoint de stats."""
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(f"{API_URL}/stats")
-            data = resp.json()
-            
-            assert "queues" in data
-            assert "status" in data
-            
-            print(f"\n✓ Stats Celery:")
-            print(f"  Queues: {data.get('queues')}")
-            print(f"  Workers: {data.get('workers')}")
-            print(f"  Active tasks: {data.get('active_tasks')}")
-
-
-class TestEmbeddings:
-    """Tests des embeddings batch."""
-    
-    def test_embeddings_endpoint(self):
-        """Vérifie l'endpoint embeddings."""
-        response = httpx.post(
-            f"{API_URL}/embeddings",
-            json={"texts": ["Hello", "World"]},
-            timeout=10
-        )
-        
-        assert response.status_code == 200
-        data = response.json()
+        data = get_json("/stats")
         
-        assert data["status"] == "queued"
-        assert "task_id" in data
+        assert "queues" in data
+        assert "status" in data
         
-        print(f"\n✓ Embeddings task créée: {data['task_id']}")
+        print(f"\n✓ Stats Celery:")
+        print(f"  Queues: {data.get('queues')}")
+        print(f"  Workers: {data.get('workers')}")
+        print(f"  Active tasks: {data.get('active_tasks')}")
 
 
 # Configuration pytest
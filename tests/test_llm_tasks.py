@@ -0,0 +1,131 @@
+"""
+Tests unitaires de la tâche chat_completion (sans worker ni Redis ni OpenAI).
+
+La tâche est exécutée en eager (apply): les retries Celery sont rejoués
+dans le même process. Redis et le client OpenAI sont remplacés par des
+doublures qui enregistrent les events du stream de session.
+
+Usage:
+    pytest tests/test_llm_tasks.py -v
+"""
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from app.tasks import llm_tasks
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.results = []
+    
+    def xadd(self, key, fields, **kwargs):
+        self.redis.streams.setdefault(key, []).append((fields["t"], fields["d"]))
+        self.results.append(b"0-1")
+    
+    def get(self, key):
+        self.results.append(None)
+    
+    def pttl(self, key):
+        self.results.append(-2)
+    
+    def __getattr__(self, name):
+        # expire, set...: sans effet
+        return lambda *args, **kwargs: self.results.append(True)
+    
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.streams = {}
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+    
+    def publish(self, channel, message):
+        return 0
+    
+    def set(self, *args, **kwargs):
+        return True
+
+
+def _chunk(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def _connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+class FakeOpenAI:
+    """Client OpenAI dont chaque appel create() joue le scénario suivant."""
+    
+    def __init__(self, *scenarios):
+        self.scenarios = list(scenarios)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(with_raw_response=self))
+    
+    def create(self, **params):
+        self.calls += 1
+        scenario = self.scenarios.pop(0)
+        if isinstance(scenario, Exception):
+            raise scenario
+        return SimpleNamespace(headers={}, parse=lambda: scenario())
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(llm_tasks, "get_redis", lambda: redis)
+    return redis
+
+
+def _run(monkeypatch, client):
+    monkeypatch.setattr(llm_tasks, "get_openai", lambda: client)
+    return llm_tasks.chat_completion.apply(kwargs={
+        "session_id": "s1",
+        "completion_params": {"model": "gpt-test", "messages": [{"role": "user", "content": "OK?"}], "stream": True},
+    })
+
+
+def test_transient_error_then_successful_retry(monkeypatch, fake_redis):
+    """Erreur transitoire puis retry réussi: pas d'event error, la réponse du retry est streamée."""
+    def answer():
+        yield _chunk("O")
+        yield _chunk("K")
+    
+    client = FakeOpenAI(_connection_error(), answer)
+    result = _run(monkeypatch, client)
+    
+    assert result.successful()
+    assert client.calls == 2
+    
+    events = fake_redis.streams["llm:stream:s1"]
+    kinds = [kind for kind, _ in events]
+    assert "error" not in kinds
+    assert kinds[-1] == "done"
+    assert "".join(data for kind, data in events if kind == "chunk") == "OK"
+
+
+def test_transient_error_after_chunks_is_terminal(monkeypatch, fake_redis):
+    """Erreur transitoire après des deltas publiés: un seul event error, pas de retry (pas de doublon)."""
+    def interrupted():
+        # Assez long pour être publié avant l'erreur
+        yield _chunk("x" * llm_tasks.STREAM_PUBLISH_MIN_CHARS)
+        raise _connection_error()
+    
+    client = FakeOpenAI(interrupted)
+    result = _run(monkeypatch, client)
+    
+    assert result.failed()
+    assert client.calls == 1
+    
+    kinds = [kind for kind, _ in fake_redis.streams["llm:stream:s1"]]
+    assert kinds.count("error") == 1
+    assert kinds[-1] == "error"
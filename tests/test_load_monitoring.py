@@ -15,12 +15,23 @@ Prérequis:
     pip install docker psutil
 """
 import asyncio
-import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import statistics
 import time
 import threading
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from functools import lru_cache, partial
+from typing import Awaitable, Callable, List, Dict, Optional
+import orjson
 import pytest
+import pytest_asyncio
 import httpx
 
 # Docker SDK
@@ -35,18 +46,65 @@ except ImportError:
 API_URL = "http://localhost:8007"
 TIMEOUT = 300.0
 
+# Pool du client de charge: un POST + un stream SSE par requête
+LOAD_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+
+# Event de fin du stream SSE, cherché directement dans les octets reçus
+# (les deltas sont échappés en JSON: \"type\" ne peut pas correspondre)
+_TERMINAL = re.compile(rb'"type"\s*:\s*"(?:complete|error|timeout)"')
+_TERMINAL_TAIL = 64
+
+# Intervalle du polling de status (mode poll_completion)
+POLL_INTERVAL = 0.1
+
+# Retry des erreurs transitoires (429, connexion refusée, timeout de lecture):
+# backoff exponentiel RETRY_BACKOFF * 2**tentative
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.1
+_TRANSIENT = (httpx.ConnectError, httpx.ReadTimeout)
+
 # Containers à monitorer
 CONTAINERS = ["llm-api", "llm-worker", "llm-redis"]
 
+# Échantillons gardés par container (ring buffer: les plus anciens sont évincés)
+MAX_SAMPLES = 10_000
+
+# cgroup v2 (lecture directe des stats, sans dockerd)
+CGROUP_ROOT = "/sys/fs/cgroup"
+HOST_MEMORY = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") if hasattr(os, "sysconf") else 0
+
+
+# Échantillon brut d'un sampler: (timestamp, cpu_percent, memory_mb, memory_percent)
+Sample = tuple
+
 
 @dataclass
-class ResourceSnapshot:
-    """Snapshot des ressources à un instant T."""
-    timestamp: float
-    container: str
-    cpu_percent: float
-    memory_mb: float
-    memory_percent: float
+class ResourceSeries:
+    """
+    Séries de ressources d'un container (SoA: un array contigu par métrique,
+    pas d'objet par échantillon).
+    """
+    timestamp: array = field(default_factory=lambda: array("d"))
+    cpu_percent: array = field(default_factory=lambda: array("f"))
+    memory_mb: array = field(default_factory=lambda: array("f"))
+    memory_percent: array = field(default_factory=lambda: array("f"))
+    
+    def __len__(self) -> int:
+        return len(self.timestamp)
+    
+    def append(self, sample: Sample):
+        timestamp, cpu_percent, memory_mb, memory_percent = sample
+        self.timestamp.append(timestamp)
+        self.cpu_percent.append(cpu_percent)
+        self.memory_mb.append(memory_mb)
+        self.memory_percent.append(memory_percent)
+    
+    @classmethod
+    def from_samples(cls, samples) -> "ResourceSeries":
+        series = cls()
+        for sample in samples:
+            series.append(sample)
+        return series
 
 
 @dataclass
@@ -59,8 +117,11 @@ class LoadTestResult:
     avg_latency: float
     min_latency: float
     max_latency: float
+    p50_latency: float
+    p95_latency: float
+    p99_latency: float
     throughput: float  # req/s
-    snapshots: List[ResourceSnapshot] = field(default_factory=list)
+    snapshots: Dict[str, ResourceSeries] = field(default_factory=dict)
     
     def print_summary(self):
         print(f"\n{'='*60}")
@@ -74,10 +135,11 @@ class LoadTestResult:
         print(f"  Latence min:     {self.min_latency:.2f}s")
         print(f"  Latence max:     {self.max_latency:.2f}s")
         print(f"  Latence moyenne: {self.avg_latency:.2f}s")
+        print(f"  Latence p50/p95/p99: {self.p50_latency:.2f}s / {self.p95_latency:.2f}s / {self.p99_latency:.2f}s")
         print(f"{'='*60}")
     
     def print_resource_stats(self):
-        if not self.snapshots:
+        if not any(self.snapshots.values()):
             print("\n  ⚠️ Pas de données de monitoring Docker")
             return
         
@@ -85,23 +147,16 @@ class LoadTestResult:
         print(f"  🖥️  RESSOURCES DOCKER")
         print(f"{'='*60}")
         
-        # Group by container
-        by_container: Dict[str, List[ResourceSnapshot]] = {}
-        for snap in self.snapshots:
-            if snap.container not in by_container:
-                by_container[snap.container] = []
-            by_container[snap.container].append(snap)
-        
-        for container, snaps in sorted(by_container.items()):
-            if not snaps:
+        for container, series in sorted(self.snapshots.items()):
+            if not series:
                 continue
             
-            cpu_values = [s.cpu_percent for s in snaps]
-            mem_values = [s.memory_mb for s in snaps]
+            cpu_values = series.cpu_percent
+            mem_values = series.memory_mb
             
-            cpu_avg = sum(cpu_values) / len(cpu_values)
+            cpu_avg = math.fsum(cpu_values) / len(cpu_values)
             cpu_max = max(cpu_values)
-            mem_avg = sum(mem_values) / len(mem_values)
+            mem_avg = math.fsum(mem_values) / len(mem_values)
             mem_max = max(mem_values)
             
             print(f"\n  📦 {container}")
@@ -111,16 +166,53 @@ class LoadTestResult:
         print(f"\n{'='*60}")
 
 
-class DockerMonitor:
-    """Moniteur de ressources Docker en temps réel."""
+@lru_cache(maxsize=None)
+def _docker_client() -> "docker.DockerClient":
+    """Client Docker du process (un seul pool de connexions dockerd)."""
+    return docker.from_env()
+
+
+class _DockerSampler:
+    """
+    Échantillonnage des ressources Docker (threads, dans le process courant).
+    
+    Le thread de cadence prend un snapshot par container toutes les
+    `interval` secondes, via la source la moins coûteuse disponible:
+    
+    - cgroup v2: lecture directe de cpu.stat / memory.current / memory.max
+      (quelques µs, pas d'aller-retour dockerd); delta CPU sur le tour précédent.
+    - stream=True (défaut, fallback cgroup v1 / Docker Desktop): un thread
+      lecteur par container consomme le flux stats de dockerd (~1 échantillon/s
+      déjà moyenné) et garde le dernier; stream=False bloquait ~1s par
+      container et par tour.
+    - stream=False: un appel one-shot par container et par tour (Docker >= 20.10,
+      sans l'attente de 1s côté dockerd); delta CPU sur le tour précédent.
+    
+    Les containers sont échantillonnés en parallèle (un thread du pool chacun):
+    un tour dure le max des latences, pas leur somme, et un container bloqué
+    ne retarde pas les autres.
     
-    def __init__(self, containers: List[str], interval: float = 0.5):
+    La cadence ne fait qu'empiler les échantillons dans un ring buffer borné
+    par container (max_samples); les séries SoA sont construites à stop().
+    """
+    
+    def __init__(self, containers: List[str], interval: float = 0.5, stream: bool = True,
+                 max_samples: int = MAX_SAMPLES):
         self.containers = containers
         self.interval = interval
-        self.snapshots: List[ResourceSnapshot] = []
+        self.stream = stream
+        self._rings: Dict[str, deque] = {name: deque(maxlen=max_samples) for name in containers}
         self._running = False
         self._thread: Optional[threading.Thread] = None
+        self._readers: List[threading.Thread] = []
+        self._samplers: Dict[str, Callable[[], Optional[Sample]]] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._latest: Dict[str, dict] = {}
+        self._prev: Dict[str, object] = {}
+        self._stats_urls: Dict[str, str] = {}
+        self._lock = threading.Lock()
         self._client: Optional[docker.DockerClient] = None
+        self._containers: Dict[str, object] = {}
     
     def start(self):
         """Démarre le monitoring en background."""
@@ -129,75 +221,344 @@ class DockerMonitor:
             return
         
         try:
-            self._client = docker.from_env()
+            self._client = _docker_client()
+            # Handles résolus et validés une fois: un container absent est
+            # écarté ici plutôt que de lever NotFound à chaque tour
+            for container_name in self.containers:
+                try:
+                    self._containers[container_name] = self._client.containers.get(container_name)
+                except docker.errors.NotFound:
+                    print(f"  ⚠️ Container introuvable, non monitoré: {container_name}")
             self._running = True
+            for container_name in self._containers:
+                cgroup = self._cgroup_dir(container_name)
+                if cgroup:
+                    self._samplers[container_name] = partial(self._sample_cgroup, container_name, cgroup)
+                elif self.stream:
+                    reader = threading.Thread(target=self._read_stats, args=(container_name,), daemon=True)
+                    reader.start()
+                    self._readers.append(reader)
+                    self._samplers[container_name] = partial(self._sample_latest, container_name)
+                else:
+                    self._samplers[container_name] = partial(self._sample_one_shot, container_name)
+            self._pool = ThreadPoolExecutor(max_workers=max(1, len(self._samplers)), thread_name_prefix="docker-stats")
             self._thread = threading.Thread(target=self._monitor_loop, daemon=True)
             self._thread.start()
-            print(f"  📊 Monitoring démarré pour: {', '.join(self.containers)}")
+            print(f"  📊 Monitoring démarré pour: {', '.join(self._containers)}")
         except Exception as e:
             print(f"  ⚠️ Erreur Docker: {e}")
     
-    def stop(self) -> List[ResourceSnapshot]:
-        """Arrête le monitoring et retourne les snapshots."""
+    def stop(self) -> Dict[str, ResourceSeries]:
+        """Arrête le monitoring et retourne les séries par container."""
         self._running = False
         if self._thread:
             self._thread.join(timeout=2)
-        return self.snapshots
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        # Les lecteurs s'arrêtent à leur prochain échantillon (~1s)
+        for reader in self._readers:
+            reader.join(timeout=2)
+        return {name: ResourceSeries.from_samples(ring) for name, ring in self._rings.items()}
     
     def _monitor_loop(self):
-        """Boucle de monitoring."""
+        """Boucle de cadence: un snapshot par container toutes les `interval` secondes."""
+        pending: Dict[str, Future] = {}
+        
         while self._running:
-            for container_name in self.containers:
+            # Un appel encore en cours (container lent) n'est pas relancé
+            for container_name, sample in self._samplers.items():
+                if container_name not in pending:
+                    pending[container_name] = self._pool.submit(sample)
+            
+            # Échéance globale du tour
+            done, _ = wait(pending.values(), timeout=self.interval * 1.5)
+            for container_name, future in list(pending.items()):
+                if future not in done:
+                    continue
+                del pending[container_name]
                 try:
-                    container = self._client.containers.get(container_name)
-                    stats = container.stats(stream=False)
-                    
-                    # Calcul CPU
-                    cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
-                                stats['precpu_stats']['cpu_usage']['total_usage']
-                    system_delta = stats['cpu_stats']['system_cpu_usage'] - \
-                                   stats['precpu_stats']['system_cpu_usage']
-                    num_cpus = stats['cpu_stats'].get('online_cpus', 1)
-                    
-                    if system_delta > 0:
-                        cpu_percent = (cpu_delta / system_delta) * num_cpus * 100
-                    else:
-                        cpu_percent = 0
-                    
-                    # Calcul mémoire
-                    mem_usage = stats['memory_stats'].get('usage', 0)
-                    mem_limit = stats['memory_stats'].get('limit', 1)
-                    mem_mb = mem_usage / (1024 * 1024)
-                    mem_percent = (mem_usage / mem_limit) * 100 if mem_limit > 0 else 0
-                    
-                    self.snapshots.append(ResourceSnapshot(
-                        timestamp=time.time(),
-                        container=container_name,
-                        cpu_percent=cpu_percent,
-                        memory_mb=mem_mb,
-                        memory_percent=mem_percent
-                    ))
+                    sample = future.result()
+                    if sample is not None:
+                        self._rings[container_name].append(sample)
                     
-                except docker.errors.NotFound:
-                    pass  # Container pas trouvé
                 except Exception as e:
                     pass  # Ignore les erreurs de stats
             
             time.sleep(self.interval)
+    
+    # ------------------------------------------------------------
+    # Source cgroup v2
+    # ------------------------------------------------------------
+    
+    def _cgroup_dir(self, container_name: str) -> Optional[str]:
+        """Dossier cgroup v2 du container, None si indisponible (v1, Docker Desktop...)."""
+        if not os.path.exists(f"{CGROUP_ROOT}/cgroup.controllers"):
+            return None
+        container_id = self._containers[container_name].id
+        for path in (
+            f"{CGROUP_ROOT}/system.slice/docker-{container_id}.scope",  # driver systemd
+            f"{CGROUP_ROOT}/docker/{container_id}",                     # driver cgroupfs
+        ):
+            if os.path.exists(f"{path}/cpu.stat"):
+                return path
+        return None
+    
+    def _sample_cgroup(self, container_name: str, path: str) -> Optional[Sample]:
+        now = time.monotonic()
+        with open(f"{path}/cpu.stat", "rb") as f:
+            usage_usec = next(int(line[11:]) for line in f if line.startswith(b"usage_usec "))
+        with open(f"{path}/memory.current", "rb") as f:
+            mem_usage = int(f.read())
+        with open(f"{path}/memory.max", "rb") as f:
+            raw = f.read().strip()
+        # Pas de limite: dockerd rapporte la RAM de l'hôte
+        mem_limit = HOST_MEMORY if raw == b"max" else int(raw)
+        
+        prev = self._prev.get(container_name)
+        self._prev[container_name] = (now, usage_usec)
+        if prev is None:
+            return None
+        
+        # Même échelle que docker stats: 100% = un cœur
+        prev_time, prev_usage = prev
+        elapsed_usec = (now - prev_time) * 1_000_000
+        cpu_percent = (usage_usec - prev_usage) / elapsed_usec * 100 if elapsed_usec > 0 else 0
+        
+        mem_percent = (mem_usage / mem_limit) * 100 if mem_limit > 0 else 0
+        return (time.time(), cpu_percent, mem_usage / (1024 * 1024), mem_percent)
+    
+    # ------------------------------------------------------------
+    # Sources dockerd
+    # ------------------------------------------------------------
+    
+    def _read_stats(self, container_name: str):
+        """Lecteur du flux stats d'un container (garde le dernier échantillon)."""
+        try:
+            # Réponse HTTP streamée gardée en main (le générateur du SDK ne la
+            # ferme pas); flux brut (un JSON par ligne) décodé avec orjson
+            response = self._client.api.get(self._stats_url(container_name), params={"stream": "true"}, stream=True)
+            response.raise_for_status()
+        except Exception:
+            return  # Ignore les erreurs de stats
+        
+        try:
+            buf = bytearray()
+            for chunk in response.iter_content(chunk_size=None):
+                buf += chunk
+                if (i := buf.rfind(b"\n")) == -1:
+                    continue
+                # Dernier échantillon complet du bloc, le reste attend la suite
+                line = bytes(buf[:i]).rsplit(b"\n", 1)[-1]
+                del buf[:i + 1]
+                if line.strip():
+                    stats = orjson.loads(line)
+                    with self._lock:
+                        self._latest[container_name] = stats
+                if not self._running:
+                    break
+        except Exception:
+            pass  # Flux coupé (container arrêté...)
+        finally:
+            # Ferme la réponse HTTP: libère la connexion dockerd
+            response.close()
+    
+    def _sample_latest(self, container_name: str) -> Optional[Sample]:
+        with self._lock:
+            stats = self._latest.get(container_name)
+        if stats is None:
+            return None
+        try:
+            return self._sample(stats, stats['precpu_stats'])
+        except (KeyError, TypeError):
+            return None  # Échantillon incomplet (premier du flux)
+    
+    def _stats_url(self, container_name: str) -> str:
+        """URL de l'endpoint stats du container (construite une fois)."""
+        url = self._stats_urls.get(container_name)
+        if url is None:
+            api = self._client.api
+            container_id = self._containers[container_name].id
+            url = self._stats_urls[container_name] = f"{api.base_url}/v{api.api_version}/containers/{container_id}/stats"
+        return url
+    
+    def _sample_one_shot(self, container_name: str) -> Optional[Sample]:
+        # Réponse brute décodée avec orjson (le SDK passe par json)
+        response = self._client.api.get(self._stats_url(container_name), params={"stream": "false", "one-shot": "true"})
+        response.raise_for_status()
+        stats = orjson.loads(response.content)
+        # precpu_stats est vide en one-shot: on garde le cpu_stats précédent
+        prev = self._prev.get(container_name)
+        self._prev[container_name] = stats['cpu_stats']
+        if prev is None:
+            return None
+        return self._sample(stats, prev)
+    
+    @staticmethod
+    def _sample(stats: dict, prev_cpu: dict) -> Sample:
+        """CPU/RAM d'un échantillon stats de dockerd (delta CPU depuis prev_cpu)."""
+        # Calcul CPU
+        cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
+                    prev_cpu['cpu_usage']['total_usage']
+        system_delta = stats['cpu_stats']['system_cpu_usage'] - \
+                       prev_cpu['system_cpu_usage']
+        num_cpus = stats['cpu_stats'].get('online_cpus', 1)
+        
+        if system_delta > 0:
+            cpu_percent = (cpu_delta / system_delta) * num_cpus * 100
+        else:
+            cpu_percent = 0
+        
+        # Calcul mémoire
+        mem_usage = stats['memory_stats'].get('usage', 0)
+        mem_limit = stats['memory_stats'].get('limit', 1)
+        mem_mb = mem_usage / (1024 * 1024)
+        mem_percent = (mem_usage / mem_limit) * 100 if mem_limit > 0 else 0
+        
+        return (time.time(), cpu_percent, mem_mb, mem_percent)
+
+
+def _monitor_process(containers: List[str], interval: float, stream: bool, ready, stop, results):
+    """Process du moniteur: échantillonne jusqu'à `stop`, puis renvoie les séries."""
+    sampler = _DockerSampler(containers, interval, stream)
+    sampler.start()
+    ready.set()
+    stop.wait()
+    results.put(sampler.stop())
+
+
+class DockerMonitor:
+    """
+    Moniteur de ressources Docker en temps réel.
+    
+    L'échantillonnage (_DockerSampler) tourne dans un process séparé: ni ses
+    threads ni le décodage des stats ne prennent le GIL du process de charge
+    (event loop httpx + streams SSE). Les séries sont rapatriées à stop().
+    """
+    
+    def __init__(self, containers: List[str], interval: float = 0.5, stream: bool = True):
+        self.containers = containers
+        self.interval = interval
+        self.stream = stream
+        self.snapshots: Dict[str, ResourceSeries] = {name: ResourceSeries() for name in containers}
+        self._process: Optional[multiprocessing.Process] = None
+        self._stop = None
+        self._results = None
+    
+    def start(self):
+        """Démarre le monitoring en background (retourne une fois l'échantillonnage lancé)."""
+        if not DOCKER_AVAILABLE:
+            print("  ⚠️ Docker SDK non disponible")
+            return
+        
+        # spawn: pas de fork d'un process multi-threadé (pytest, xdist)
+        ctx = multiprocessing.get_context("spawn")
+        ready = ctx.Event()
+        self._stop = ctx.Event()
+        self._results = ctx.Queue()
+        self._process = ctx.Process(
+            target=_monitor_process,
+            args=(self.containers, self.interval, self.stream, ready, self._stop, self._results),
+            daemon=True,
+        )
+        self._process.start()
+        if not ready.wait(timeout=30):
+            print("  ⚠️ Process de monitoring non démarré")
+    
+    def stop(self) -> Dict[str, ResourceSeries]:
+        """Arrête le monitoring et retourne les séries par container."""
+        if self._process is None:
+            return self.snapshots
+        
+        self._stop.set()
+        # Lire la queue avant join (sinon le process peut bloquer à l'écriture)
+        try:
+            self.snapshots = self._results.get(timeout=10)
+        except queue.Empty:
+            print("  ⚠️ Pas de résultats du process de monitoring")
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+        return self.snapshots
+
+
+def _percentiles(values: List[float]) -> tuple:
+    """p50/p95/p99 de latences triées (0 si aucune)."""
+    if len(values) < 2:
+        return (values[0],) * 3 if values else (0, 0, 0)
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+def make_client() -> httpx.AsyncClient:
+    """
+    Client HTTP de charge (keepalive partagé entre tests et requêtes).
+    
+    http2=True n'a d'effet que derrière un proxy TLS parlant HTTP/2 (streams
+    SSE multiplexés); uvicorn sert du HTTP/1.1 en clair (pas de h2c), httpx y
+    reste en HTTP/1.1. Requiert h2 (httpx[http2]).
+    """
+    return httpx.AsyncClient(base_url=API_URL, timeout=TIMEOUT, limits=LOAD_LIMITS, http2=True)
+
+
+async def _with_retry(call: Callable[[], Awaitable[httpx.Response]], transient: tuple = _TRANSIENT) -> httpx.Response:
+    """
+    Appelle call() avec backoff exponentiel sur erreur transitoire.
+    
+    Réessaie sur les exceptions `transient` et sur une réponse 429 (fermée
+    avant la tentative suivante); la dernière tentative retourne sa réponse
+    ou lève son exception.
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        last = attempt == RETRY_ATTEMPTS - 1
+        try:
+            response = await call()
+        except transient:
+            if last:
+                raise
+        else:
+            if last or response.status_code != 429:
+                return response
+            await response.aclose()
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+async def _open_stream(client: httpx.AsyncClient, session_id: str) -> httpx.Response:
+    """Ouvre le stream SSE de la session (en-têtes reçus, corps non lu)."""
+    return await client.send(client.build_request("GET", f"/stream/{session_id}"), stream=True)
+
+
+async def _wait_stream_end(stream: httpx.Response):
+    """Lit le stream SSE jusqu'à l'event de fin (octets bruts, sans découpage ni JSON)."""
+    buf = bytearray()
+    async for chunk in stream.aiter_bytes():
+        buf += chunk
+        if _TERMINAL.search(buf):
+            return
+        # Garde la fin: l'event peut chevaucher deux blocs
+        del buf[:-_TERMINAL_TAIL]
 
 
 async def run_load_test(
+    client: httpx.AsyncClient,
     num_requests: int,
     message: str = "Dis juste OK",
-    monitor: bool = True
+    monitor: bool = True,
+    concurrency: Optional[int] = None,
+    poll_completion: bool = False
 ) -> LoadTestResult:
     """
     Lance un test de charge avec monitoring.
     
     Args:
+        client: Client HTTP partagé (voir make_client)
         num_requests: Nombre de requêtes à envoyer
         message: Message à envoyer
         monitor: Activer le monitoring Docker
+        concurrency: Requêtes en vol max (défaut: max_connections // 2,
+            chaque requête tenant deux connexions: POST + SSE)
+        poll_completion: Attendre la fin via GET /chat/{task_id} (polling)
+            plutôt qu'un stream SSE ouvert par requête
     
     Returns:
         LoadTestResult avec stats et snapshots
@@ -212,80 +573,99 @@ async def run_load_test(
         docker_monitor = DockerMonitor(CONTAINERS, interval=0.5)
         docker_monitor.start()
     
-    # Préparer les requêtes
-    latencies: List[float] = []
+    # Préparer les requêtes: latences préallouées, remplies par index (NaN = échec)
+    latencies = array("d", [math.nan]) * num_requests
     errors: List[str] = []
     
-    # Augmenter les limites de connexions pour le parallélisme
-    limits = httpx.Limits(max_connections=200, max_keepalive_connections=100)
-    async with httpx.AsyncClient(timeout=TIMEOUT, limits=limits) as client:
-        start_total = time.time()
-        
-        async def send_request(index: int) -> Optional[float]:
-            """Envoie une requête et attend la réponse complète."""
-            start = time.time()
+    # Borne les requêtes en vol: au-delà, elles attendent sans ouvrir de connexion
+    sem = asyncio.Semaphore(concurrency or LOAD_LIMITS.max_connections // 2)
+    
+    # Horloge monotone haute résolution (insensible aux sauts NTP)
+    start_total = time.perf_counter_ns()
+    
+    async def send_request(index: int):
+        """Envoie une requête et attend la réponse complète."""
+        async with sem:
+            start = time.perf_counter_ns()
             try:
-                # 1. POST /chat (fire-and-forget)
-                resp = await client.post(
-                    f"{API_URL}/chat",
+                # 1. POST /chat (fire-and-forget), réessayé si 429 / erreur réseau
+                resp = await _with_retry(partial(
+                    client.post,
+                    "/chat",
                     json={"message": f"{message} #{index}"}
-                )
+                ))
                 
                 if resp.status_code != 200:
                     errors.append(f"#{index}: HTTP {resp.status_code}")
                     return None
                 
                 data = resp.json()
-                session_id = data["session_id"]
                 
-                # 2. Attendre la réponse via SSE
-                async with client.stream("GET", f"{API_URL}/stream/{session_id}") as stream:
-                    async for line in stream.aiter_lines():
-                        if line.startswith("data:"):
-                            try:
-                                event = json.loads(line[5:].strip())
-                                if event.get("type") in ("complete", "error", "timeout"):
-                                    break
-                            except:
-                                pass
+                if poll_completion:
+                    # 2. Attendre la fin par polling du status (pas de connexion tenue),
+                    # borné: une tâche perdue reste PENDING indéfiniment
+                    status_url = f"/chat/{data['task_id']}"
+                    deadline = time.monotonic() + TIMEOUT
+                    while not (await client.get(status_url)).json()["ready"]:
+                        if time.monotonic() >= deadline:
+                            errors.append(f"#{index}: pas terminée après {TIMEOUT:.0f}s")
+                            return None
+                        await asyncio.sleep(POLL_INTERVAL)
+                else:
+                    # 2. Attendre la réponse via SSE: seule l'ouverture est
+                    # réessayée (connexion refusée, 429); un timeout en cours
+                    # de lecture est un échec
+                    stream = await _with_retry(
+                        partial(_open_stream, client, data["session_id"]),
+                        transient=(httpx.ConnectError,),
+                    )
+                    try:
+                        if stream.status_code != 200:
+                            errors.append(f"#{index}: SSE HTTP {stream.status_code}")
+                            return None
+                        await _wait_stream_end(stream)
+                    finally:
+                        await stream.aclose()
                 
-                elapsed = time.time() - start
-                return elapsed
+                latencies[index] = (time.perf_counter_ns() - start) / 1e9
                 
             except Exception as e:
                 errors.append(f"#{index}: {str(e)[:50]}")
                 return None
-        
-        # Lancer toutes les requêtes en parallèle
-        print(f"  ⏳ Envoi de {num_requests} requêtes...")
-        tasks = [send_request(i) for i in range(num_requests)]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        total_time = time.time() - start_total
+    
+    # Lancer toutes les requêtes en parallèle; chaque tâche est libérée dès
+    # sa fin (pas de liste de résultats gardée jusqu'à la dernière)
+    print(f"  ⏳ Envoi de {num_requests} requêtes...")
+    for finished in asyncio.as_completed([send_request(i) for i in range(num_requests)]):
+        try:
+            await finished
+        except Exception as e:
+            errors.append(str(e)[:50])
+    
+    total_time = (time.perf_counter_ns() - start_total) / 1e9
     
     # Arrêter le monitoring
-    snapshots = []
+    snapshots = {}
     if docker_monitor:
         snapshots = docker_monitor.stop()
     
     # Analyser les résultats
-    for r in results:
-        if isinstance(r, float):
-            latencies.append(r)
-        elif isinstance(r, Exception):
-            errors.append(str(r)[:50])
-    
-    successful = len(latencies)
+    succeeded = sorted(x for x in latencies if not math.isnan(x))
+    successful = len(succeeded)
     failed = num_requests - successful
+    p50, p95, p99 = _percentiles(succeeded)
     
     result = LoadTestResult(
         num_requests=num_requests,
         total_time=total_time,
         successful=successful,
         failed=failed,
-        avg_latency=sum(latencies) / len(latencies) if latencies else 0,
-        min_latency=min(latencies) if latencies else 0,
-        max_latency=max(latencies) if latencies else 0,
+        avg_latency=math.fsum(succeeded) / successful if succeeded else 0,
+        min_latency=succeeded[0] if succeeded else 0,
+        max_latency=succeeded[-1] if succeeded else 0,
+        p50_latency=p50,
+        p95_latency=p95,
+        p99_latency=p99,
         throughput=successful / total_time if total_time > 0 else 0,
         snapshots=snapshots
     )
@@ -305,33 +685,41 @@ async def run_load_test(
 # TESTS PYTEST
 # ============================================================
 
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def load_client():
+    """Client de charge partagé par toute la session."""
+    async with make_client() as client:
+        yield client
+
+
+@pytest.mark.xdist_group("server_load")
 class TestLoadWithMonitoring:
     """Tests de charge avec monitoring Docker."""
     
-    @pytest.mark.asyncio
-    async def test_health_check(self):
-        """Vérifie que l'API est accessible."""
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(f"{API_URL}/health")
-            assert resp.status_code == 200
-            print(f"\n✅ API accessible")
+    def test_health_check(self, get_json):
+        """Vérifie que l'API est accessible (réponse /health partagée par la session)."""
+        assert get_json("/health")["status"] == "ok"
+        print(f"\n✅ API accessible")
     
-    @pytest.mark.asyncio
-    async def test_simultaneous_requests(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_simultaneous_requests(self, load_client):
         """
         Test de charge simultanée.
         
         Configure via variable d'env ou directement ici:
             LOAD_TEST_COUNT=20 pytest -k test_simultaneous
+            LOAD_TEST_POLL=1 pytest -k test_simultaneous   # polling au lieu du SSE
         
         ⚠️ Pour des appels vraiment simultanés, assure-toi que:
            - CELERY_RATE_LIMIT=0 (ou très haut) dans .env
            - Redémarre le worker après modification
         """
-        import os
         num_requests = int(os.getenv("LOAD_TEST_COUNT", "20"))
+        poll_completion = os.getenv("LOAD_TEST_POLL") == "1"
         
-        result = await run_load_test(num_requests=num_requests, message="1")
+        result = await run_load_test(
+            load_client, num_requests=num_requests, message="1", poll_completion=poll_completion
+        )
         result.print_summary()
         result.print_resource_stats()
         
@@ -347,17 +735,17 @@ class TestLoadWithMonitoring:
         assert result.successful >= num_requests * 0.8, f"Trop d'échecs: {result.failed}"
 
 
+@pytest.mark.xdist_group("server_load")
 class TestMemoryProfile:
     """Tests spécifiques pour le profiling mémoire."""
     
-    @pytest.mark.asyncio
-    async def test_memory_profile(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_memory_profile(self, load_client):
         """
         Profil mémoire complet: baseline → charge → récupération.
         
         Utilise seulement 10 requêtes pour économiser l'API.
         """
-        import os
         num_requests = int(os.getenv("MEMORY_TEST_COUNT", "10"))
         
         print(f"\n{'='*60}")
@@ -369,18 +757,18 @@ class TestMemoryProfile:
         monitor = DockerMonitor(["llm-worker"], interval=0.5)
         monitor.start()
         await asyncio.sleep(2)
-        baseline_snaps = monitor.stop()
-        baseline_mem = sum(s.memory_mb for s in baseline_snaps) / len(baseline_snaps) if baseline_snaps else 0
+        baseline_snaps = monitor.stop()["llm-worker"].memory_mb
+        baseline_mem = math.fsum(baseline_snaps) / len(baseline_snaps) if baseline_snaps else 0
         print(f"  → {baseline_mem:.0f}MB")
         
         # 2. Sous charge
         print(f"\n  Phase 2: Charge ({num_requests} requêtes)...")
-        result = await run_load_test(num_requests=num_requests, message="1", monitor=True)
+        result = await run_load_test(load_client, num_requests=num_requests, message="1", monitor=True)
         
         load_mem = 0
-        worker_snaps = [s for s in result.snapshots if "worker" in s.container]
+        worker_snaps = result.snapshots.get("llm-worker", ResourceSeries()).memory_mb
         if worker_snaps:
-            load_mem = max(s.memory_mb for s in worker_snaps)
+            load_mem = max(worker_snaps)
             print(f"  → Max: {load_mem:.0f}MB (+{load_mem - baseline_mem:.0f}MB)")
         
         # 3. Récupération
@@ -389,8 +777,8 @@ class TestMemoryProfile:
         monitor = DockerMonitor(["llm-worker"], interval=0.5)
         monitor.start()
         await asyncio.sleep(2)
-        after_snaps = monitor.stop()
-        after_mem = sum(s.memory_mb for s in after_snaps) / len(after_snaps) if after_snaps else 0
+        after_snaps = monitor.stop()["llm-worker"].memory_mb
+        after_mem = math.fsum(after_snaps) / len(after_snaps) if after_snaps else 0
         print(f"  → {after_mem:.0f}MB")
         
         # Résumé
@@ -406,7 +794,8 @@ class TestMemoryProfile:
 if __name__ == "__main__":
     # Test rapide en standalone
     async def main():
-        result = await run_load_test(num_requests=20, message="Test")
+        async with make_client() as client:
+            result = await run_load_test(client, num_requests=20, message="Test")
         result.print_summary()
         result.print_resource_stats()
     